@@ -2,33 +2,57 @@ import os
 import html
 import random
 import json
+import threading
 import streamlit as st
-from PIL import Image
 from dotenv import load_dotenv
 
-from core.stylist import get_outfit_recommendation
-from core.analyzer import analyze_clothing
-from core.database import load_closet_data, save_item
-from utils.helpers import img_to_b64_data_uri, split_recommendations, parse_recommendation
+from core.stylist import iter_recommendations, get_outfit_variations, local_recommendation, polish_recommendation, STYLIST_MODE
+from core.retrieval import build_closet_context
+from core.analyzer import analyze_clothing, analyze_clothing_batch, analysis_cache_stats
+from core.database import save_item, get_closet_view, get_closet_page, count_items, get_item, image_path_for, validate_user_id, DEFAULT_USER
+from utils.helpers import split_recommendations, parse_analysis, closet_grid_html
+from utils.parser import Recommendation, parse_one, resolve_items
+from utils.images import prepare_image, save_prepared_image, content_filename
+from utils.thumbnails import thumbnail_src, ensure_thumbnails, backfill_thumbnails
+from core.telemetry import span, timed, start_metrics_server, recent_spans, usage_totals
 
 # --- Config ---
 st.set_page_config(page_title="AI Personal Stylist v3", page_icon="👗", layout="wide", initial_sidebar_state="auto")
 load_dotenv()
 VARIATION_COUNT = int(os.getenv("VARIATION_COUNT", "3"))
+# "single": one streamed completion with all variations; "parallel": one concurrent request per variation
+VARIATION_MODE = os.getenv("VARIATION_MODE", "single")
+# Shows per-request timings, tokens and cost under the outfit panel
+DEBUG_PANEL = os.getenv("VARA_DEBUG_PANEL", "0") == "1"
+# Closet tiles rendered per "Show more" step
+CLOSET_PAGE_SIZE = int(os.getenv("CLOSET_PAGE_SIZE", "60"))
+
+@st.cache_resource
+def start_thumbnail_backfill():
+    # Once per server process; tiles without a thumbnail yet are generated lazily by thumbnail_src
+    t = threading.Thread(target=backfill_thumbnails, daemon=True)
+    t.start()
+    return t
+
+start_thumbnail_backfill()
+
+@st.cache_resource
+def start_metrics_endpoint():
+    # No-op unless VARA_METRICS_PORT is set
+    return start_metrics_server()
+
+start_metrics_endpoint()
 
 # Inject CSS
 with open(os.path.join("assets", "style.css")) as f:
     st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
 
-def generate_mannequin_outfit(recommendation_text: str, closet_data: list[dict]):
-    rec_lower = recommendation_text.lower()
-    selected_items = []
-    for item in closet_data:
-        item_id = str(item.get("id", ""))
-        p = item.get("image_path")
-        if p and os.path.exists(p):
-            if f"item {item_id}:" in rec_lower or f"item {item_id} :" in rec_lower:
-                selected_items.append(item)
+@timed("app.generate_mannequin_outfit")
+def generate_mannequin_outfit(recommendation, user_id: str = DEFAULT_USER):
+    # Resolves the parsed item IDs through the closet's id -> item map: O(selected items), not O(closet)
+    rec = recommendation if isinstance(recommendation, Recommendation) else parse_one(recommendation)
+    items, _unknown = resolve_items(rec, lambda item_id: get_item(item_id, user_id))
+    selected_items = [dict(item) for item in items if item.get("image_path") and os.path.exists(item["image_path"])]
     if not selected_items:
         return "No matching clothing items with images found in recommendation."
     image_paths = [i["image_path"] for i in selected_items if i.get("image_path")]
@@ -36,6 +60,7 @@ def generate_mannequin_outfit(recommendation_text: str, closet_data: list[dict])
         return "No images found for selected items."
     return {"selected_items": selected_items, "image_paths": image_paths}
 
+@timed("app.render_recommendation_panel_html")
 def render_recommendation_panel_html(rec: str, outfit_result: object) -> None:
     if not rec:
         st.markdown("<div class='muted'>No recommendation yet. Describe an occasion and click \"Get Stylist Advice\".</div>", unsafe_allow_html=True)
@@ -46,7 +71,7 @@ def render_recommendation_panel_html(rec: str, outfit_result: object) -> None:
         items = outfit_result["selected_items"]
         tiles = []
         for idx, it in enumerate(items):
-            uri = img_to_b64_data_uri(it["image_path"]) if it.get("image_path") else ""
+            uri = thumbnail_src(it["image_path"], "md") if it.get("image_path") else ""
             cls = "rec-card wide" if idx == 2 else "rec-card"
             meta = html.escape((it.get("item_type", "") + (" • " + it.get("color", "") if it.get("color") else "")).strip())
             caption = (
@@ -56,18 +81,7 @@ def render_recommendation_panel_html(rec: str, outfit_result: object) -> None:
             )
             tiles.append(f"<div class='{cls}'><img src='{uri}' alt='rec'/> {caption}</div>")
         rec_html_tiles = f"<div class='rec-grid'>{''.join(tiles)}</div>"
-    sel_items, short_notes = parse_recommendation(rec)
-    # Extract full styling notes (not truncated)
-    # parse_recommendation returns (selected_items, short_notes), but we want the full styling notes
-    # We'll extract it directly here
-    import re
-    st_match = re.search(r"\*{0,2}\s*Styling Notes:\s*\*{0,2}(.*)", rec, flags=re.IGNORECASE | re.DOTALL)
-    if st_match:
-        full_styling_notes = st_match.group(1).strip()
-    else:
-        # fallback: everything after 'Styling Notes:'
-        idx = rec.lower().find('styling notes:')
-        full_styling_notes = rec[idx+len('styling notes:'):].strip() if idx != -1 else rec.strip()
+    full_styling_notes = parse_one(rec).notes or rec.strip()
     panel_html = f"""
 <div class='rec-panel'>
   {rec_html_tiles}
@@ -85,10 +99,29 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+# Each user's closet lives in its own shard; ?user=<id> in the URL picks it too
+with st.sidebar:
+    user_input = st.text_input("Closet", value=st.query_params.get("user", DEFAULT_USER), key="v3_user", help="Whose closet to show and save to")
+try:
+    USER_ID = validate_user_id(user_input)
+except ValueError as e:
+    st.sidebar.error(str(e))
+    USER_ID = DEFAULT_USER
+if st.session_state.get("v3_active_user") != USER_ID:
+    # Recommendations and uploads from another closet would point at the wrong items
+    for key in [k for k in st.session_state if k.startswith("last_")]:
+        st.session_state.pop(key, None)
+    st.session_state["v3_closet_shown"] = CLOSET_PAGE_SIZE
+    st.session_state["v3_active_user"] = USER_ID
+
 container = st.container()
 with container:
     cols = st.columns([7, 5], gap="large")
     left_col, right_col = cols
+    with right_col:
+        # Created up front so streamed recommendations can render here while the left column is still running
+        right_header = st.container()
+        panel_slot = st.empty()
     with left_col:
         st.markdown("<div class='title'>Outfit Builder</div>", unsafe_allow_html=True)
         st.markdown("<div class='subtitle'>Curate your perfect look for any occasion</div>", unsafe_allow_html=True)
@@ -102,24 +135,49 @@ with container:
                 if not occasion.strip():
                     st.warning("Please enter an occasion or situation.")
                 else:
-                    closet_data = load_closet_data()
+                    closet_data = get_closet_view(USER_ID)
                     if not closet_data:
                         st.warning("Your closet is empty — please add some clothes first.")
                     else:
-                        with st.spinner("Generating recommendations..."):
-                            seed = random.randint(0, 999999999)
+                        with st.spinner("Generating recommendations..."), span("app.get_stylist_advice", occasion=occasion) as advice_span:
+                            st.session_state["last_trace_v3"] = advice_span.trace_id
+                            fresh = st.session_state.get("v3_fresh", False)
+                            # A fixed seed keeps repeat questions cacheable; "Something new" gets a random one
+                            seed = random.randint(0, 999999999) if fresh else None
                             selected_variations = int(st.session_state.get("v3_variation_count", num_opts))
-                            raw = get_outfit_recommendation(occasion, json.dumps(closet_data, indent=2), num_variations=selected_variations, temperature=0.8, seed=seed)
-                            recs = split_recommendations(raw)
+                            closet_context, prompt_stats = build_closet_context(occasion, closet_data)
+                            st.session_state["last_prompt_stats_v3"] = prompt_stats
+                            # Caching (and "Something new" refreshing the cached answer) lives in core.stylist
+                            arrivals = iter_recommendations(occasion, closet_context, num_variations=selected_variations, temperature=0.8, seed=seed, use_cache=not fresh, mode=STYLIST_MODE, variation_mode=VARIATION_MODE)
+                            by_index = {}
+                            for i, rec in arrivals:
+                                by_index[i] = rec
+                                if len(by_index) == 1:
+                                    with panel_slot.container():
+                                        render_recommendation_panel_html(rec, generate_mannequin_outfit(rec, USER_ID))
+                            recs = [by_index[i] for i in sorted(by_index)]
+                            if not recs:
+                                # Stylist model unavailable: local outfits are shown but not cached
+                                st.info("The stylist is unavailable right now, showing locally composed outfits.")
+                                recs = split_recommendations(local_recommendation(occasion, closet_context, selected_variations, seed))
+                            st.session_state["last_query_v3"] = occasion
+                            st.session_state["last_closet_context_v3"] = closet_context
                             if not recs:
                                 st.error("Failed to parse recommendations from the model response.")
                             else:
                                 st.session_state["last_recommendations_v3"] = recs
                                 st.session_state["last_recommendation_index_v3"] = 0
                                 st.session_state["last_recommendation_v3"] = recs[0]
-                                st.session_state["last_outfit_result_v3"] = generate_mannequin_outfit(recs[0], closet_data)
+                                st.session_state["last_outfit_result_v3"] = generate_mannequin_outfit(recs[0], USER_ID)
                                 st.session_state["last_reroll_seed_v3"] = seed
                             st.session_state["last_reroll_seed_v3"] = seed
+        st.checkbox("Something new", key="v3_fresh", help="Skip previously suggested outfits for this occasion and ask the stylist again")
+        prompt_stats = st.session_state.get("last_prompt_stats_v3")
+        if prompt_stats:
+            st.caption(
+                f"Stylist saw {prompt_stats['items_after']}/{prompt_stats['items_before']} items · "
+                f"~{prompt_stats['tokens_after']:,} prompt tokens (full closet ~{prompt_stats['tokens_before']:,})"
+            )
         # with st.container():
         #     st.markdown("<div class='mobile-only'>", unsafe_allow_html=True)
         #     render_recommendation_panel_html(st.session_state.get("last_recommendation_v3"), st.session_state.get("last_outfit_result_v3"))
@@ -141,27 +199,35 @@ with container:
                     label_visibility="collapsed",
                 )
                 if uploaded_file is not None:
-                    image = Image.open(uploaded_file)
-                    st.image(image, use_container_width=True)
+                    # Pre-process once per upload, not on every rerun; the same bytes are analyzed and saved
+                    upload_id = getattr(uploaded_file, "file_id", uploaded_file.name)
+                    if st.session_state.get("v3_prepared_id") != upload_id:
+                        st.session_state["v3_prepared"] = prepare_image(uploaded_file)
+                        st.session_state["v3_prepared_id"] = upload_id
+                    prepared = st.session_state["v3_prepared"]
+                    st.image(prepared["image"], use_container_width=True)
+                    st.caption(f"Optimized {prepared['original_bytes'] / 1024:,.0f} KB → {prepared['processed_bytes'] / 1024:,.0f} KB")
                     if st.button("Analyze", key="v3_analyze_btn", use_container_width=True):
                         with st.spinner("Analyzing…"):
-                            result = analyze_clothing(image)
+                            hits_before = analysis_cache_stats()["hits"]
+                            result = analyze_clothing(prepared)
+                            cached = analysis_cache_stats()["hits"] > hits_before
                             try:
                                 st.session_state["last_analysis_v3"] = json.loads(result)
-                                st.session_state["last_image_v3"] = image
-                                st.success("Analyzed!")
+                                st.session_state["last_image_v3"] = prepared
+                                st.success("Analyzed! (cached)" if cached else "Analyzed!")
                             except Exception:
                                 st.error("Failed to analyze (invalid JSON). See raw output for debugging.")
                                 with st.expander("Raw analysis output", expanded=False):
                                     st.code(result)
                     if st.session_state.get("last_analysis_v3") and st.session_state.get("last_image_v3"):
                         if st.button("Save", key="v3_save_btn", use_container_width=True):
-                            image_filename = f"item_{len(load_closet_data())}.jpg"
-                            image_path = os.path.join("data/closet_images", image_filename)
+                            saved_prepared = st.session_state["last_image_v3"]
+                            image_path = image_path_for(content_filename(saved_prepared), USER_ID)
                             try:
-                                img_to_save = st.session_state["last_image_v3"].convert("RGB") if getattr(st.session_state["last_image_v3"], "mode", None) != "RGB" else st.session_state["last_image_v3"]
-                                img_to_save.save(image_path, format="JPEG", quality=95)
-                                if save_item(st.session_state["last_analysis_v3"], image_path):
+                                save_prepared_image(saved_prepared, image_path)
+                                ensure_thumbnails(image_path)
+                                if save_item(st.session_state["last_analysis_v3"], image_path, USER_ID):
                                     st.success("Saved to closet")
                                     st.session_state.pop("last_analysis_v3", None)
                                     st.session_state.pop("last_image_v3", None)
@@ -179,68 +245,55 @@ with container:
                     label_visibility="collapsed",
                 )
                 if uploaded_files and st.button("Analyze & Save All", key="v3_analyze_save_all", use_container_width=True):
-                    existing = load_closet_data()
-                    next_id = len(existing)
                     progress = st.progress(0)
                     success_count = 0
-                    for idx, uf in enumerate(uploaded_files):
+                    images = []
+                    for uf in uploaded_files:
                         try:
-                            image = Image.open(uf)
-                            result = analyze_clothing(image)
-                            parsed = None
-                            try:
-                                parsed = json.loads(result)
-                            except Exception:
-                                start = result.find("{")
-                                end = result.rfind("}")
-                                if start != -1 and end != -1 and end > start:
-                                    try:
-                                        parsed = json.loads(result[start : end + 1])
-                                    except Exception:
-                                        parsed = None
-                            image_filename = f"item_{next_id}.jpg"
-                            next_id += 1
-                            image_path = os.path.join("data/closet_images", image_filename)
+                            images.append(prepare_image(uf))
+                        except Exception:
+                            images.append(None)
+                    valid = [i for i, image in enumerate(images) if image is not None]
+                    results = analyze_clothing_batch(
+                        [images[i] for i in valid],
+                        on_progress=lambda done, total, _idx: progress.progress(done / len(uploaded_files)),
+                    )
+                    for idx, result in zip(valid, results):
+                        try:
+                            prepared = images[idx]
+                            parsed = parse_analysis(result)
+                            image_path = image_path_for(content_filename(prepared), USER_ID)
                             saved_image = False
                             try:
-                                img_to_save = image.convert("RGB") if getattr(image, "mode", None) != "RGB" else image
-                                img_to_save.save(image_path, format="JPEG", quality=95)
+                                save_prepared_image(prepared, image_path)
                                 saved_image = True
+                                ensure_thumbnails(image_path)
                             except Exception:
                                 saved_image = False
                             if parsed is not None and saved_image:
                                 if isinstance(parsed, dict):
                                     parsed["analysis_raw"] = result
-                                if save_item(parsed, image_path):
+                                if save_item(parsed, image_path, USER_ID):
                                     success_count += 1
                         except Exception:
                             pass
-                        progress.progress((idx + 1) / len(uploaded_files))
-                    st.success(f"Added {success_count}/{len(uploaded_files)} items!")
+                    progress.progress(1.0)
+                    bytes_saved = sum(p["bytes_saved"] for p in images if p)
+                    st.success(f"Added {success_count}/{len(uploaded_files)} items! Images shrunk by {bytes_saved / (1024 * 1024):,.1f} MB.")
+                    st.rerun()
+        # Only the visible page is loaded and rendered, so a large closet doesn't hold up the page
+        shown = st.session_state.get("v3_closet_shown", CLOSET_PAGE_SIZE)
+        closet_page = get_closet_page(0, shown, USER_ID)
+        if closet_page:
+            st.markdown(closet_grid_html(closet_page, lambda p: thumbnail_src(p, "sm")), unsafe_allow_html=True)
+            total_items = count_items(USER_ID)
+            if total_items > shown:
+                if st.button(f"Show more ({shown}/{total_items})", key="v3_closet_more", use_container_width=True):
+                    st.session_state["v3_closet_shown"] = shown + CLOSET_PAGE_SIZE
                     st.rerun()
-        closet_data = load_closet_data()
-        if closet_data:
-            tiles = []
-            for it in closet_data:
-                p = it.get("image_path")
-                name = it.get("description", "Item")
-                item_type = it.get("item_type", "")
-                color = it.get("color", "")
-                if p and os.path.exists(p):
-                    uri = img_to_b64_data_uri(p)
-                    title = html.escape(name[:40])
-                    meta = html.escape((item_type + (" • " + color) if item_type or color else "").strip())
-                    tiles.append(
-                        f"<div class='closet-card'>"
-                        f"<img src='{uri}' alt='item'/>"
-                        f"<div class='closet-caption'>"
-                        f"<div class='meta'>{meta}</div>"
-                        f"</div></div>"
-                    )
-            st.markdown(f"<div class='closet-grid'>{''.join(tiles)}</div>", unsafe_allow_html=True)
         else:
             st.info("Your closet is empty. Use 'Add Clothes' to populate it.")
-    with right_col:
+    with right_header:
         header_cols = st.columns([7, 1], gap="small")
         with header_cols[0]:
             st.markdown("<div class='section-title'><h2 style='margin:0;font-family:Playfair Display, serif'>Your Outfit</h2></div>", unsafe_allow_html=True)
@@ -250,17 +303,55 @@ with container:
             total = len(recs) if recs else 0
             if total > 0:
                 st.markdown(f"<div style='text-align:center;color:#6b7280;font-size:0.95rem'>{idx+1}/{total}</div>", unsafe_allow_html=True)
-            if st.button("↻", key="v3_reroll", help="Cycle to the next cached outfit alternative"):
+            if st.button("↻", key="v3_reroll", help="Show the next outfit alternative (a new one is fetched after the last)"):
                 if not recs:
                     st.warning("Generate recommendations first using 'Get Stylist Advice'.")
                 else:
                     new_idx = (idx + 1) % total
+                    if new_idx == 0 and st.session_state.get("last_closet_context_v3"):
+                        with st.spinner("Fetching another outfit..."):
+                            if STYLIST_MODE in ("local", "hybrid"):
+                                # The composer picks the next outfit; in hybrid mode the LLM only rewrites its notes
+                                more = split_recommendations(local_recommendation(st.session_state.get("last_query_v3", occasion), st.session_state["last_closet_context_v3"], total + 1, st.session_state.get("last_reroll_seed_v3")))[total:]
+                                if STYLIST_MODE == "hybrid" and more:
+                                    more = split_recommendations(polish_recommendation(st.session_state.get("last_query_v3", occasion), more[0], temperature=0.8))[:1]
+                            else:
+                                more = get_outfit_variations(
+                                    st.session_state.get("last_query_v3", occasion),
+                                    st.session_state["last_closet_context_v3"],
+                                    num_variations=1,
+                                    temperature=0.8,
+                                    seed=st.session_state.get("last_reroll_seed_v3"),
+                                    start_index=total,
+                                )
+                        if more:
+                            recs.append(more[0])
+                            st.session_state["last_recommendations_v3"] = recs
+                            new_idx = total
                     st.session_state["last_recommendation_index_v3"] = new_idx
                     new_rec = recs[new_idx]
                     st.session_state["last_recommendation_v3"] = new_rec
-                    st.session_state["last_outfit_result_v3"] = generate_mannequin_outfit(new_rec, load_closet_data())
+                    st.session_state["last_outfit_result_v3"] = generate_mannequin_outfit(new_rec, USER_ID)
+    with panel_slot.container():
         st.markdown("<div class='desktop-only'>", unsafe_allow_html=True)
         render_recommendation_panel_html(st.session_state.get("last_recommendation_v3"), st.session_state.get("last_outfit_result_v3"))
         st.markdown("</div>", unsafe_allow_html=True)
-        # if not st.session_state.get("last_recommendation_v3"):
-        #     st.markdown("<div class='muted'>No recommendation yet. Describe an occasion and click \"Get Stylist Advice\".</div>", unsafe_allow_html=True)
+    if DEBUG_PANEL:
+        with st.expander("Debug: last request", expanded=False):
+            trace = st.session_state.get("last_trace_v3")
+            spans = recent_spans(trace) if trace else []
+            if spans:
+                tokens_in = sum(sp["attrs"].get("input_tokens", 0) for sp in spans)
+                tokens_out = sum(sp["attrs"].get("output_tokens", 0) for sp in spans)
+                cost = sum(sp["attrs"].get("cost_usd", 0.0) for sp in spans)
+                st.caption(f"{tokens_in:,} input / {tokens_out:,} output tokens · ~${cost:.4f}")
+                st.table([
+                    {"span": sp["name"], "ms": sp["duration_ms"], **{k: v for k, v in sp["attrs"].items() if k != "occasion"}}
+                    for sp in sorted(spans, key=lambda sp: sp["start"])
+                ])
+            else:
+                st.caption("No stylist request yet in this session.")
+            totals = usage_totals()
+            st.caption(f"Process totals: {int(totals['model_calls'])} model calls · {int(totals['input_tokens']):,} in / {int(totals['output_tokens']):,} out tokens · ~${totals['cost_usd']:.4f}")
+    # if not st.session_state.get("last_recommendation_v3"):
+    #     st.markdown("<div class='muted'>No recommendation yet. Describe an occasion and click \"Get Stylist Advice\".</div>", unsafe_allow_html=True)
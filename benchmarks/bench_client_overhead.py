@@ -0,0 +1,56 @@
+# Micro-benchmark: per-call client/chain setup overhead before and after the shared registry
+# Run from the repo root: python -m benchmarks.bench_client_overhead
+import os
+import time
+import argparse
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-placeholder")
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+from openai import OpenAI
+
+from core.clients import get_openai_client
+from core.stylist import _build_chain
+
+
+def _per_call_chain():
+    # What get_outfit_recommendation used to do on every button press
+    llm = ChatOpenAI(model="gpt-4", temperature=0.8, api_key=os.environ["OPENAI_API_KEY"])
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "You are a professional fashion stylist."),
+        ("human", "{closet_data}\n{user_query}\n{variation}"),
+    ])
+    return prompt | llm | StrOutputParser()
+
+
+def _per_call_openai():
+    return OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+
+
+def _time(fn, iterations: int) -> float:
+    # One untimed call first: the registry rows then measure reuse, not the one-time build
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-call client/chain setup overhead")
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    args = parser.parse_args()
+    rows = [
+        ("stylist chain (per call)", _time(_per_call_chain, args.iterations)),
+        ("stylist chain (registry)", _time(lambda: _build_chain(0.8), args.iterations)),
+        ("OpenAI client (per call)", _time(_per_call_openai, args.iterations)),
+        ("OpenAI client (registry)", _time(get_openai_client, args.iterations)),
+    ]
+    for name, us in rows:
+        print(f"{name:<28} {us:>10.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# End-to-end benchmark suite on synthetic closets with a fake OpenAI backend
+# Run from the repo root:
+#   python -m benchmarks.bench_suite --sizes 100 1000 10000 50000 -o bench.json
+#   python -m benchmarks.bench_suite --compare before.json bench.json
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from statistics import mean
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-placeholder")
+
+import core.cache as cache
+import core.database as database
+import utils.thumbnails as thumbnails
+from core.analyzer import analyze_clothing_batch
+from core.retrieval import build_closet_context
+from core.stylist import get_outfit_recommendation, _chain_inputs, _stylist_prompt
+from utils.helpers import img_to_b64_data_uri, _cached_data_uri, closet_grid_html, split_recommendations, parse_recommendation, parse_analysis
+from utils.images import prepare_image
+
+from benchmarks.fakes import FAKE_ANALYSIS, fake_recommendation, install_fake_backends
+from benchmarks.synthetic import OCCASIONS, synthetic_closet, synthetic_images
+
+
+def _summary(name: str, size: int, samples, **extra) -> dict:
+    ordered = sorted(samples)
+    row = {
+        "name": name,
+        "size": size,
+        "iterations": len(samples),
+        "mean_ms": round(mean(samples) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+    }
+    row.update(extra)
+    return row
+
+
+def _time(fn, iterations: int, setup=None):
+    samples = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _use_workdir(workdir: str, size: int) -> None:
+    # Every closet size gets its own database; caches and thumbnails stay inside the scratch directory
+    database.CLOSET_DB = os.path.join(workdir, f"closet_{size}.db")
+    database.CLOSET_FILE = os.path.join(workdir, "missing.json")
+    cache.CACHE_DIR = os.path.join(workdir, "cache")
+    thumbnails.THUMBS_DIR = os.path.join(workdir, "thumbs")
+    database._invalidate_cache()
+
+
+def bench_storage(size: int, image_paths, batch_size: int, iterations: int):
+    rows = []
+    items = synthetic_closet(size, seed=size)
+    pairs = [(item, image_paths[i % len(image_paths)]) for i, item in enumerate(items)]
+    batches = []
+    for start in range(0, len(pairs), batch_size):
+        t0 = time.perf_counter()
+        database.save_items(pairs[start:start + batch_size])
+        batches.append(time.perf_counter() - t0)
+    rows.append(_summary("save_items_batch", size, batches, batch_size=batch_size))
+    # Single inserts go to a scratch copy so the closet measured below keeps exactly `size` items
+    closet_db = database.CLOSET_DB
+    scratch_db = f"{os.path.splitext(closet_db)[0]}_scratch.db"
+    shutil.copyfile(closet_db, scratch_db)
+    database.CLOSET_DB = scratch_db
+    try:
+        singles = _time(lambda: database.save_item(dict(items[0]), pairs[0][1]), min(iterations * 5, 100))
+    finally:
+        database.CLOSET_DB = closet_db
+    rows.append(_summary("save_item", size, singles))
+    rows.append(_summary("load_closet_data_cold", size, _time(database.load_closet_data, iterations, setup=database._invalidate_cache)))
+    rows.append(_summary("load_closet_data_warm", size, _time(database.load_closet_data, iterations)))
+    rows.append(_summary("get_closet_view_warm", size, _time(database.get_closet_view, iterations)))
+    return rows
+
+
+def bench_grid(size: int, iterations: int, unique_images: int):
+    closet = database.get_closet_view()
+    rows = [
+        _summary("closet_grid_b64_cold", size, _time(lambda: closet_grid_html(closet, img_to_b64_data_uri), iterations, setup=_cached_data_uri.cache_clear), unique_images=unique_images),
+        _summary("closet_grid_b64_warm", size, _time(lambda: closet_grid_html(closet, img_to_b64_data_uri), iterations), unique_images=unique_images),
+    ]
+    html_bytes = len(closet_grid_html(closet, img_to_b64_data_uri))
+    thumb_src = lambda p: thumbnails.thumbnail_src(p, "sm")
+    closet_grid_html(closet, thumb_src)  # first pass generates the thumbnails
+    rows.append(_summary("closet_grid_thumbs", size, _time(lambda: closet_grid_html(closet, thumb_src), iterations), html_bytes_b64=html_bytes, html_bytes_thumbs=len(closet_grid_html(closet, thumb_src))))
+    return rows
+
+
+def bench_prompt(size: int, iterations: int, variations: int, latency: float):
+    closet = database.get_closet_view()
+    rows = []
+    contexts = {}
+
+    def build():
+        occasion = random.choice(OCCASIONS)
+        contexts[occasion] = build_closet_context(occasion, closet)
+
+    rows.append(_summary("build_closet_context", size, _time(build, iterations)))
+    occasion, (context, stats) = next(iter(contexts.items()))
+    # Prompt work alone; the end-to-end row below also includes the fake model's latency
+    prompt = _stylist_prompt()
+    rows.append(_summary(
+        "format_stylist_prompt", size,
+        _time(lambda: prompt.format_messages(**_chain_inputs(occasion, context, None, variations)), iterations),
+        variations=variations, **stats,
+    ))
+    rows.append(_summary(
+        "get_outfit_recommendation", size,
+        _time(lambda: get_outfit_recommendation(occasion, context, num_variations=variations, temperature=0.8, use_cache=False, mode="llm"), iterations),
+        variations=variations, fake_latency_ms=latency * 1000, **stats,
+    ))
+    rows.append(_summary("get_outfit_recommendation_cached", size, _time(lambda: get_outfit_recommendation(occasion, context, num_variations=variations, temperature=0.8, mode="llm"), iterations)))
+    return rows
+
+
+def bench_parsers(iterations: int, variations: int):
+    ids = "".join(f'"id":{i},' for i in range(1, 40))
+    raw = fake_recommendation(ids, variations)
+    recs = split_recommendations(raw)
+    analysis = "Here is the analysis:\n```json\n" + json.dumps(FAKE_ANALYSIS) + "\n```"
+    loops = 1000
+    return [
+        _summary("split_recommendations", variations, [s / loops for s in _time(lambda: [split_recommendations(raw) for _ in range(loops)], iterations)]),
+        _summary("parse_recommendation", 1, [s / loops for s in _time(lambda: [parse_recommendation(recs[0]) for _ in range(loops)], iterations)]),
+        _summary("parse_analysis", 1, [s / loops for s in _time(lambda: [parse_analysis(analysis) for _ in range(loops)], iterations)]),
+    ]
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def bench_ingest(image_paths, workers: int, latency: float):
+    start = time.perf_counter()
+    prepared = [prepare_image(_read(p)) for p in image_paths]
+    prep_time = time.perf_counter() - start
+    start = time.perf_counter()
+    analyze_clothing_batch(prepared, max_workers=workers, use_cache=False)
+    elapsed = time.perf_counter() - start
+    return [
+        _summary("prepare_image", 1, [prep_time / len(image_paths)], images=len(image_paths)),
+        _summary("analyze_clothing_batch", len(image_paths), [elapsed], workers=workers, fake_latency_ms=latency * 1000, images_per_s=round(len(image_paths) / elapsed, 2)),
+    ]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def run(args) -> dict:
+    random.seed(args.seed)
+    install_fake_backends(args.latency, args.jitter)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="vara-bench-") as workdir:
+        unique = min(args.images, max(args.sizes))
+        image_paths = synthetic_images(os.path.join(workdir, "images"), unique, seed=args.seed)
+        _use_workdir(workdir, 0)
+        results += bench_ingest(image_paths[:args.ingest_images], args.workers, args.latency)
+        results += bench_parsers(args.iterations, args.variations)
+        for size in sorted(args.sizes):
+            print(f"closet size {size}...", file=sys.stderr)
+            _use_workdir(workdir, size)
+            results += bench_storage(size, image_paths, args.batch_size, args.iterations)
+            if size <= args.grid_max:
+                results += bench_grid(size, args.iterations, min(unique, size))
+            results += bench_prompt(size, args.iterations, args.variations, args.latency)
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+
+
+def compare(before_path: str, after_path: str) -> None:
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    old = {(r["name"], r["size"]): r for r in before["results"]}
+    print(f"{'benchmark':<36} {'size':>7} {before['commit']:>12} {after['commit']:>12} {'change':>8}")
+    for r in after["results"]:
+        prev = old.get((r["name"], r["size"]))
+        if not prev:
+            continue
+        change = (r["p50_ms"] / prev["p50_ms"] - 1) * 100 if prev["p50_ms"] else 0.0
+        print(f"{r['name']:<36} {r['size']:>7} {prev['p50_ms']:>10.3f}ms {r['p50_ms']:>10.3f}ms {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vara benchmark suite with a fake OpenAI backend")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("-n", "--iterations", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=500, help="Items per save_items transaction")
+    parser.add_argument("--images", type=int, default=200, help="Distinct synthetic images; closet items reuse them in turn")
+    parser.add_argument("--ingest-images", type=int, default=50, help="Images pushed through prepare/analyze")
+    parser.add_argument("--grid-max", type=int, default=10000, help="Skip grid rendering for larger closets")
+    parser.add_argument("--variations", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write JSON results here (stdout otherwise)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Print p50 changes between two result files")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
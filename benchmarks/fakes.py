@@ -0,0 +1,89 @@
+# Local stand-ins for OpenAI and ChatOpenAI with configurable latency, so benchmarks make no network calls
+import re
+import json
+import time
+import random
+from types import SimpleNamespace
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+import core.clients as clients
+
+_ID_RE = re.compile(r'"id":\s*(\d+)')
+
+FAKE_ANALYSIS = {
+    "item_type": "t-shirt", "color": "navy blue", "pattern": "solid", "style": "casual",
+    "season": "summer", "material": "cotton", "fit": "regular", "details": "crew neck",
+    "description": "A navy blue cotton t-shirt with a crew neck.",
+}
+
+
+class _Latency:
+    def __init__(self, latency: float, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+
+    def wait(self) -> None:
+        self.calls += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FakeResponses:
+    def __init__(self, latency: _Latency):
+        self._latency = latency
+
+    def create(self, model=None, input=None, **kwargs):
+        self._latency.wait()
+        return SimpleNamespace(output_text=json.dumps(FAKE_ANALYSIS), usage=SimpleNamespace(input_tokens=800, output_tokens=90))
+
+
+class FakeOpenAI:
+    # Covers the parts of openai.OpenAI that core.analyzer uses
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = _Latency(latency, jitter)
+        self.responses = FakeResponses(self.latency)
+
+    def with_options(self, **kwargs):
+        return self
+
+
+def fake_recommendation(prompt_text: str, num_variations: int = 1) -> str:
+    # Picks items that really are in the prompt's closet JSON, in the format the stylist prompt asks for
+    ids = _ID_RE.findall(prompt_text) or ["1"]
+    blocks = []
+    for i in range(num_variations):
+        picked = ids[i % len(ids):][:3] or ids[:3]
+        lines = "\n".join(f"- Item {item_id}: navy blue t-shirt" for item_id in picked)
+        body = f"**Selected Items:**\n{lines}\n\n**Styling Notes:**\nNeutral pieces keep the look easy to wear and simple to accessorize."
+        blocks.append(f"=== Recommendation {i + 1} ===\n{body}" if num_variations > 1 else body)
+    return "\n\n".join(blocks)
+
+
+def fake_chat_model(latency: float = 0.0, jitter: float = 0.0):
+    # A runnable that slots into prompt | llm | StrOutputParser() in place of ChatOpenAI
+    waiter = _Latency(latency, jitter)
+
+    def respond(prompt_value, seed=None):
+        # seed arrives through llm.bind(seed=...) like on ChatOpenAI; the canned answer ignores it
+        waiter.wait()
+        text = prompt_value.to_string()
+        match = re.search(r"Provide EXACTLY (\d+) distinct", text)
+        return AIMessage(content=fake_recommendation(text, int(match.group(1)) if match else 1))
+
+    model = RunnableLambda(respond)
+    model.latency = waiter
+    return model
+
+
+def install_fake_backends(latency: float = 0.0, jitter: float = 0.0):
+    # Swaps the shared client factories in core.clients; every caller goes through them
+    api = FakeOpenAI(latency, jitter)
+    chat = fake_chat_model(latency, jitter)
+    clients._openai_client = lambda api_key: api
+    clients._chat_model = lambda model, temperature, api_key: chat
+    clients._chains.clear()
+    return api, chat
@@ -0,0 +1,158 @@
+# Load test: many concurrent sessions across user closets, one of them much larger than the rest
+# Run from the repo root: python -m benchmarks.load_test --sessions 32 --users 8 --big-closet 20000
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-placeholder")
+
+import core.cache as cache
+import core.database as database
+import utils.thumbnails as thumbnails
+from core.retrieval import build_closet_context
+from core.stylist import get_outfit_recommendation
+from utils.helpers import closet_grid_html, img_to_b64_data_uri
+from utils.images import prepare_image, save_prepared_image, content_filename
+
+from benchmarks.fakes import install_fake_backends
+from benchmarks.synthetic import OCCASIONS, synthetic_closet, synthetic_image, synthetic_images
+
+PAGE_SIZE = 60
+
+
+def _use_workdir(workdir: str) -> None:
+    database.USERS_DIR = os.path.join(workdir, "users")
+    database.CLOSET_DB = os.path.join(workdir, "default.db")
+    database.CLOSET_FILE = os.path.join(workdir, "missing.json")
+    database.IMAGES_DIR = os.path.join(workdir, "default_images")
+    cache.CACHE_DIR = os.path.join(workdir, "cache")
+    thumbnails.THUMBS_DIR = os.path.join(workdir, "thumbs")
+
+
+def seed_closets(users, big_user: str, big_size: int, small_size: int, image_paths) -> None:
+    for n, user in enumerate(users):
+        size = big_size if user == big_user else small_size
+        items = synthetic_closet(size, seed=n)
+        for start in range(0, size, 1000):
+            chunk = items[start:start + 1000]
+            database.save_items([(it, image_paths[(start + i) % len(image_paths)]) for i, it in enumerate(chunk)], user)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def time(self, group: str, op: str, fn):
+        start = time.perf_counter()
+        try:
+            return fn()
+        except Exception:
+            with self.lock:
+                self.errors[(group, op)] = self.errors.get((group, op), 0) + 1
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.samples.setdefault((group, op), []).append(elapsed)
+
+
+def run_session(session: int, user: str, group: str, args, recorder: Recorder, stop_at: float) -> None:
+    rng = random.Random(session)
+    while time.perf_counter() < stop_at:
+        action = rng.random()
+        if action < 0.5:
+            def page():
+                items = database.get_closet_page(0, PAGE_SIZE, user)
+                database.count_items(user)
+                return closet_grid_html(items, img_to_b64_data_uri)
+            recorder.time(group, "closet_page", page)
+        elif action < 0.5 + args.upload_ratio:
+            def upload():
+                path = os.path.join(args.workdir, "uploads", f"{session}_{rng.randrange(10**9)}.jpg")
+                prepared = prepare_image(_read(synthetic_image(path, rng, size=(400, 500))))
+                image_path = os.path.join(database.images_dir(user), content_filename(prepared))
+                save_prepared_image(prepared, image_path)
+                return database.save_item({"item_type": "t-shirt", "color": "white", "style": "casual"}, image_path, user)
+            recorder.time(group, "upload", upload)
+        else:
+            def advice():
+                occasion = rng.choice(OCCASIONS)
+                context, _stats = build_closet_context(occasion, database.get_closet_view(user))
+                return get_outfit_recommendation(occasion, context, num_variations=2, temperature=0.8, seed=rng.randrange(10**6), use_cache=False, mode=args.mode)
+            recorder.time(group, "advice", advice)
+        time.sleep(rng.uniform(0, args.think_time))
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def summarize(recorder: Recorder, elapsed: float) -> list:
+    rows = []
+    for (group, op), samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        rows.append({
+            "group": group,
+            "op": op,
+            "count": len(samples),
+            "errors": recorder.errors.get((group, op), 0),
+            "per_s": round(len(samples) / elapsed, 2),
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent multi-user session load test")
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--big-closet", type=int, default=20000, help="Items in the one large closet")
+    parser.add_argument("--small-closet", type=int, default=200, help="Items in every other closet")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to run")
+    parser.add_argument("--upload-ratio", type=float, default=0.1, help="Share of actions that save a new item")
+    parser.add_argument("--think-time", type=float, default=0.05, help="Max random pause between actions in seconds")
+    parser.add_argument("--mode", choices=["llm", "local"], default="local", help="llm uses the fake model backend")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake model latency in seconds (llm mode)")
+    parser.add_argument("-o", "--output", help="Write JSON results here")
+    args = parser.parse_args()
+
+    install_fake_backends(args.latency)
+    with tempfile.TemporaryDirectory(prefix="vara-load-") as workdir:
+        args.workdir = workdir
+        _use_workdir(workdir)
+        users = [f"user{i}" for i in range(args.users)]
+        big_user = users[0]
+        image_paths = synthetic_images(os.path.join(workdir, "images"), 50)
+        os.makedirs(os.path.join(workdir, "uploads"), exist_ok=True)
+        print(f"Seeding {len(users)} closets ({args.big_closet} items for {big_user}, {args.small_closet} for the rest)...", file=sys.stderr)
+        seed_closets(users, big_user, args.big_closet, args.small_closet, image_paths)
+
+        recorder = Recorder()
+        started = time.perf_counter()
+        stop_at = started + args.duration
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            for session in range(args.sessions):
+                user = users[session % len(users)]
+                pool.submit(run_session, session, user, "big" if user == big_user else "small", args, recorder, stop_at)
+        rows = summarize(recorder, time.perf_counter() - started)
+
+    print(f"{'group':<6} {'op':<12} {'count':>7} {'errors':>6} {'/s':>7} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for r in rows:
+        print(f"{r['group']:<6} {r['op']:<12} {r['count']:>7} {r['errors']:>6} {r['per_s']:>7} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['max_ms']:>9}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "workdir"}, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Synthetic closets and garment photos for the benchmark suite
+import os
+import random
+from typing import Dict, List
+
+from PIL import Image, ImageDraw
+
+ITEM_TYPES = ["t-shirt", "shirt", "blouse", "sweater", "hoodie", "jeans", "trousers", "chinos", "skirt", "shorts",
+              "dress", "jumpsuit", "blazer", "jacket", "coat", "cardigan", "sneakers", "boots", "loafers", "heels"]
+COLORS = ["black", "white", "navy blue", "grey", "beige", "olive green", "burgundy", "light blue denim", "camel", "red", "pink", "mustard"]
+STYLES = ["casual", "smart casual", "business", "formal", "streetwear", "athletic", "bohemian", "minimalist", "chic"]
+SEASONS = ["spring", "summer", "fall", "winter", "all-season"]
+FITS = ["slim", "regular", "relaxed", "oversized"]
+PATTERNS = ["solid", "striped", "checked", "floral", "plain"]
+MATERIALS = ["cotton", "wool", "linen", "denim", "leather", "polyester", "silk"]
+
+OCCASIONS = ["job interview at a bank", "first date at a wine bar", "summer wedding", "rainy day at the office",
+             "weekend brunch", "winter hike", "concert", "beach holiday"]
+
+
+def synthetic_item(rng: random.Random) -> Dict:
+    item_type, color = rng.choice(ITEM_TYPES), rng.choice(COLORS)
+    return {
+        "item_type": item_type,
+        "color": color,
+        "pattern": rng.choice(PATTERNS),
+        "style": rng.choice(STYLES),
+        "season": rng.choice(SEASONS),
+        "material": rng.choice(MATERIALS),
+        "fit": rng.choice(FITS),
+        "details": "",
+        "description": f"A {color} {item_type} for everyday wear.",
+    }
+
+
+def synthetic_closet(n: int, seed: int = 0) -> List[Dict]:
+    rng = random.Random(seed)
+    return [synthetic_item(rng) for _ in range(n)]
+
+
+def synthetic_image(path: str, rng: random.Random, size=(800, 1000)) -> str:
+    # A flat background with a few coloured shapes: compresses like a product photo, not like noise
+    img = Image.new("RGB", size, (245, 245, 245))
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(3, 8)):
+        x0, y0 = rng.randrange(size[0] // 2), rng.randrange(size[1] // 2)
+        x1, y1 = x0 + rng.randrange(50, size[0] // 2), y0 + rng.randrange(50, size[1] // 2)
+        draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+    img.save(path, format="JPEG", quality=90)
+    return path
+
+
+def synthetic_images(directory: str, count: int, seed: int = 0, size=(800, 1000)) -> List[str]:
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    return [synthetic_image(os.path.join(directory, f"synthetic_{i}.jpg"), rng, size) for i in range(count)]
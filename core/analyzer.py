@@ -1,49 +1,199 @@
 # Image analysis logic
 import base64
-import io
+import hashlib
 import os
 import json
-from openai import OpenAI
+import random
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional, Tuple, Union
+import openai
 from PIL import Image
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-def analyze_clothing(pil_image: Image.Image) -> str:
-    prompt = (
-        "Analyze this image of a clothing item in detail. Return ONLY a valid JSON object with these keys:\n"
-        "- item_type: specific type (e.g., 'button-down shirt', 'skinny jeans', 'blazer')\n"
-        "- color: primary and secondary colors (e.g., 'navy blue', 'black with white stripes')\n"
-        "- pattern: detailed pattern description (e.g., 'vertical pinstripes', 'floral print', 'solid')\n"
-        "- style: style category (e.g., 'business casual', 'streetwear', 'formal', 'bohemian')\n"
-        "- season: suitable seasons (e.g., 'spring/summer', 'all-season', 'winter')\n"
-        "- material: fabric type if visible (e.g., 'cotton', 'denim', 'wool blend', 'silk')\n"
-        "- fit: fit description (e.g., 'slim fit', 'oversized', 'tailored', 'relaxed')\n"
-        "- details: notable features (e.g., 'gold buttons', 'ripped knees', 'collar', 'pockets')\n"
-        "- description: a comprehensive 2-3 sentence description of the item\n"
-        "Do not add markdown formatting or code blocks."
-    )
+from core.cache import cache_get, cache_put, cache_stats, make_key
+from core.clients import get_openai_client
+from core.telemetry import record_usage, timed
+from utils.helpers import parse_analysis
+from utils.images import prepare_image
+
+ANALYSIS_MODEL = "gpt-4.1"
+BATCH_MAX_WORKERS = int(os.getenv("ANALYZE_MAX_WORKERS", "4"))
+BATCH_TIMEOUT = float(os.getenv("ANALYZE_TIMEOUT", "60"))
+BATCH_MAX_RETRIES = int(os.getenv("ANALYZE_MAX_RETRIES", "3"))
+
+# Bump ANALYSIS_PROMPT_VERSION whenever ANALYSIS_PROMPT changes so stale cached analyses are not reused
+ANALYSIS_PROMPT_VERSION = "1"
+ANALYSIS_CACHE_NAMESPACE = "analysis"
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+ANALYSIS_CACHE_MAX_AGE = float(os.getenv("ANALYSIS_CACHE_MAX_AGE_DAYS", "90")) * 86400
+
+# Errors worth another attempt: rate limits, timeouts and transient server/connection failures
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+ANALYSIS_PROMPT = (
+    "Analyze this image of a clothing item in detail. Return ONLY a valid JSON object with these keys:\n"
+    "- item_type: specific type (e.g., 'button-down shirt', 'skinny jeans', 'blazer')\n"
+    "- color: primary and secondary colors (e.g., 'navy blue', 'black with white stripes')\n"
+    "- pattern: detailed pattern description (e.g., 'vertical pinstripes', 'floral print', 'solid')\n"
+    "- style: style category (e.g., 'business casual', 'streetwear', 'formal', 'bohemian')\n"
+    "- season: suitable seasons (e.g., 'spring/summer', 'all-season', 'winter')\n"
+    "- material: fabric type if visible (e.g., 'cotton', 'denim', 'wool blend', 'silk')\n"
+    "- fit: fit description (e.g., 'slim fit', 'oversized', 'tailored', 'relaxed')\n"
+    "- details: notable features (e.g., 'gold buttons', 'ripped knees', 'collar', 'pockets')\n"
+    "- description: a comprehensive 2-3 sentence description of the item\n"
+    "Do not add markdown formatting or code blocks."
+)
+
+FALLBACK_ANALYSIS = json.dumps({"item_type": "unknown", "color": "unknown", "pattern": "unknown", "style": "unknown", "season": "all-season", "material": "unknown", "fit": "unknown", "details": "", "description": "Unable to analyze (API error)."})
+
+
+def _encode_image(prepared: dict) -> str:
+    base64_image = base64.b64encode(prepared["bytes"]).decode("utf-8")
+    return f"data:{prepared['mime']};base64,{base64_image}"
+
+
+def analysis_cache_key(pil_image: Image.Image) -> str:
+    # Hash decoded pixels rather than file bytes so re-saves and metadata changes still hit
+    normalized = pil_image.convert("RGB") if pil_image.mode != "RGB" else pil_image
+    digest = hashlib.sha256(normalized.tobytes()).hexdigest()
+    return make_key(digest, normalized.size, ANALYSIS_PROMPT_VERSION, ANALYSIS_MODEL)
+
+
+def _cached_analysis(key: str):
+    return cache_get(ANALYSIS_CACHE_NAMESPACE, key, max_age=ANALYSIS_CACHE_MAX_AGE)
 
-    img_byte_arr = io.BytesIO()
-    pil_image.save(img_byte_arr, format=pil_image.format or "PNG")
-    img_bytes = img_byte_arr.getvalue()
 
-    base64_image = base64.b64encode(img_bytes).decode("utf-8")
-    mime_type = "image/jpeg" if (pil_image.format or "").lower() in ["jpeg", "jpg"] else "image/png"
+def _store_analysis(key: str, result: str) -> None:
+    # Unparseable answers are never cached, so retrying the photo asks the model again
+    if not isinstance(parse_analysis(result), dict):
+        return
+    cache_put(ANALYSIS_CACHE_NAMESPACE, key, result, max_entries=ANALYSIS_CACHE_MAX_ENTRIES)
 
+
+def analysis_cache_stats() -> dict:
+    return cache_stats(ANALYSIS_CACHE_NAMESPACE)
+
+
+def _request_analysis(image_url: str, api_client=None, timeout: float | None = None) -> str:
+    api = api_client or get_openai_client()
+    if timeout is not None:
+        api = api.with_options(timeout=timeout, max_retries=0)
+    started = time.perf_counter()
+    response = api.responses.create(
+        model=ANALYSIS_MODEL,
+        input=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "input_text", "text": ANALYSIS_PROMPT},
+                    {"type": "input_image", "image_url": image_url},
+                ],
+            }
+        ],
+    )
+    usage = getattr(response, "usage", None)
+    record_usage(ANALYSIS_MODEL, getattr(usage, "input_tokens", 0), getattr(usage, "output_tokens", 0), time.perf_counter() - started, "analysis")
+    return response.output_text
+
+
+@timed("analyzer.analyze_clothing")
+def analyze_clothing(image: Union[Image.Image, dict], use_cache: bool = True) -> str:
+    # Accepts a PIL image or the output of utils.images.prepare_image (preferred, so it's only processed once)
+    prepared = prepare_image(image)
+    key = analysis_cache_key(prepared["image"]) if use_cache else None
+    if key:
+        cached = _cached_analysis(key)
+        if cached is not None:
+            return cached
     try:
-        response = client.responses.create(
-            model="gpt-4.1",
-            input=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "input_text", "text": prompt},
-                        {"type": "input_image", "image_url": f"data:{mime_type};base64,{base64_image}"},
-                    ],
-                }
-            ],
-        )
-        return response.output_text
+        result = _request_analysis(_encode_image(prepared))
     except Exception as e:
-        return json.dumps({"item_type": "unknown", "color": "unknown", "pattern": "unknown", "style": "unknown", "season": "all-season", "material": "unknown", "fit": "unknown", "details": "", "description": "Unable to analyze (API error)."})
+        return FALLBACK_ANALYSIS
+    if key:
+        _store_analysis(key, result)
+    return result
+
+
+def _analyze_with_retries(image_url: str, api_client, timeout: float, max_retries: int, backoff: float) -> str:
+    attempt = 0
+    while True:
+        try:
+            return _request_analysis(image_url, api_client=api_client, timeout=timeout)
+        except RETRYABLE_ERRORS:
+            if attempt >= max_retries:
+                raise
+            # Exponential backoff with jitter so parallel workers don't retry in lockstep
+            time.sleep(backoff * (2 ** attempt) + random.uniform(0, backoff))
+            attempt += 1
+
+
+def _timed_analysis(image_url: str, api_client, timeout: float, max_retries: int, backoff: float) -> Tuple[str, float]:
+    # Timed on the worker so the duration covers this item's requests, not its wait in the pool
+    started = time.perf_counter()
+    result = _analyze_with_retries(image_url, api_client, timeout, max_retries, backoff)
+    return result, time.perf_counter() - started
+
+
+@timed("analyzer.analyze_clothing_batch")
+def analyze_clothing_batch(
+    images: List[Union[Image.Image, dict]],
+    max_workers: int = BATCH_MAX_WORKERS,
+    timeout: float = BATCH_TIMEOUT,
+    max_retries: int = BATCH_MAX_RETRIES,
+    backoff: float = 1.0,
+    on_progress: Optional[Callable[[int, int, int], None]] = None,
+    api_client=None,
+    use_cache: bool = True,
+    durations: Optional[List[Optional[float]]] = None,
+) -> List[str]:
+    # Runs analyses on a bounded thread pool and returns results in input order.
+    # on_progress(done, total, index) is called from the calling thread as each item finishes;
+    # items that still fail after retries get the same fallback JSON as analyze_clothing.
+    # When a durations list is passed it receives each item's own request time in seconds
+    # (retries included, queueing excluded) at its index; cache hits stay None.
+    total = len(images)
+    results: List[str] = [FALLBACK_ANALYSIS] * total
+    if not total:
+        return results
+    if durations is not None:
+        durations[:] = [None] * total
+    done = 0
+    # Prepare up front on the calling thread: PIL images lazily read from their source file
+    prepared = [prepare_image(img) for img in images]
+    keys: List[Optional[str]] = [None] * total
+    pending = []
+    for idx, item in enumerate(prepared):
+        if use_cache:
+            keys[idx] = analysis_cache_key(item["image"])
+            cached = _cached_analysis(keys[idx])
+            if cached is not None:
+                results[idx] = cached
+                done += 1
+                if on_progress:
+                    on_progress(done, total, idx)
+                continue
+        pending.append(idx)
+    if not pending:
+        return results
+    image_urls = {idx: _encode_image(prepared[idx]) for idx in pending}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as pool:
+        futures = {
+            # Each worker runs in a copy of this context so its usage lands on the caller's span
+            pool.submit(contextvars.copy_context().run, _timed_analysis, image_urls[idx], api_client, timeout, max_retries, backoff): idx
+            for idx in pending
+        }
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                results[idx], elapsed = future.result()
+                if durations is not None:
+                    durations[idx] = elapsed
+                if keys[idx]:
+                    _store_analysis(keys[idx], results[idx])
+            except Exception:
+                results[idx] = FALLBACK_ANALYSIS
+            done += 1
+            if on_progress:
+                on_progress(done, total, idx)
+    return results
@@ -0,0 +1,134 @@
+# Persistent on-disk cache for model responses
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Optional
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'cache')
+# Size limits passed to cache_put are enforced every this many writes per namespace (and on the
+# first write in a process), so a namespace can briefly exceed max_entries by up to this many - 1
+CACHE_EVICT_EVERY = max(1, int(os.getenv("CACHE_EVICT_EVERY", "50")))
+
+_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+_writes_since_evict: Dict[str, int] = {}
+
+
+def make_key(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def _namespace_dir(namespace: str) -> str:
+    return os.path.join(CACHE_DIR, namespace)
+
+
+def _entry_path(namespace: str, key: str) -> str:
+    return os.path.join(_namespace_dir(namespace), f"{key}.json")
+
+
+def _bump(namespace: str, counter: str, n: int = 1) -> None:
+    with _lock:
+        stats = _stats.setdefault(namespace, {"hits": 0, "misses": 0, "writes": 0, "evictions": 0})
+        stats[counter] += n
+
+
+def cache_get(namespace: str, key: str, max_age: Optional[float] = None):
+    path = _entry_path(namespace, key)
+    try:
+        st = os.stat(path)
+        # Entries expire by creation time; mtime is refreshed on every hit for LRU ordering
+        with open(path, "r") as f:
+            entry = json.load(f)
+        if max_age is not None and time.time() - entry.get("created", st.st_mtime) > max_age:
+            os.remove(path)
+            _bump(namespace, "evictions")
+            _bump(namespace, "misses")
+            return None
+        os.utime(path)
+    except Exception:
+        _bump(namespace, "misses")
+        return None
+    _bump(namespace, "hits")
+    return entry.get("value")
+
+
+def cache_put(namespace: str, key: str, value, max_entries: Optional[int] = None, max_bytes: Optional[int] = None) -> bool:
+    directory = _namespace_dir(namespace)
+    path = _entry_path(namespace, key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump({"created": time.time(), "value": value}, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    _bump(namespace, "writes")
+    if (max_entries is not None or max_bytes is not None) and _eviction_due(namespace):
+        cache_evict(namespace, max_entries=max_entries, max_bytes=max_bytes)
+    return True
+
+
+def _eviction_due(namespace: str) -> bool:
+    # Scanning the namespace directory costs O(entries), so it is amortized over several writes
+    with _lock:
+        pending = _writes_since_evict.get(namespace)
+        if pending is None or pending + 1 >= CACHE_EVICT_EVERY:
+            _writes_since_evict[namespace] = 0
+            return True
+        _writes_since_evict[namespace] = pending + 1
+        return False
+
+
+def cache_evict(namespace: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None, max_age: Optional[float] = None) -> int:
+    directory = _namespace_dir(namespace)
+    entries = []
+    try:
+        with os.scandir(directory) as it:
+            for e in it:
+                if e.name.endswith(".json"):
+                    st = e.stat()
+                    entries.append((st.st_mtime, st.st_size, e.path))
+    except FileNotFoundError:
+        return 0
+    # Least recently used first; max_age here drops entries idle for longer than max_age
+    entries.sort()
+    now = time.time()
+    total_bytes = sum(size for _, size, _ in entries)
+    remaining = len(entries)
+    removed = 0
+    for mtime, size, path in entries:
+        too_many = max_entries is not None and remaining > max_entries
+        too_big = max_bytes is not None and total_bytes > max_bytes
+        too_old = max_age is not None and now - mtime > max_age
+        if not (too_many or too_big or too_old):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        remaining -= 1
+        total_bytes -= size
+        removed += 1
+    if removed:
+        _bump(namespace, "evictions", removed)
+    return removed
+
+
+def cache_clear(namespace: str) -> int:
+    return cache_evict(namespace, max_entries=0)
+
+
+def cache_stats(namespace: str) -> Dict[str, int]:
+    with _lock:
+        return dict(_stats.get(namespace, {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}))
@@ -0,0 +1,69 @@
+# Shared, lazily constructed OpenAI clients and LangChain chains
+import os
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, Hashable
+
+import httpx
+
+from core.telemetry import usage_callback
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("OPENAI_HTTP_TIMEOUT", "120"))
+
+_chains: Dict[Hashable, object] = {}
+_chains_lock = threading.Lock()
+
+
+def get_api_key():
+    # Read on every call so a key loaded by dotenv after import is still picked up
+    return os.getenv("OPENAI_API_KEY")
+
+
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    # One pooled keep-alive connection set shared by every OpenAI/LangChain client in the process
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=10.0),
+    )
+
+
+@lru_cache(maxsize=None)
+def _openai_client(api_key: str):
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, http_client=get_http_client())
+
+
+def get_openai_client():
+    return _openai_client(get_api_key())
+
+
+@lru_cache(maxsize=None)
+def _chat_model(model: str, temperature: float, api_key: str):
+    from langchain_openai import ChatOpenAI
+    # stream_usage makes streamed completions report token counts too
+    return ChatOpenAI(model=model, temperature=temperature, api_key=api_key, http_client=get_http_client(), stream_usage=True, callbacks=[usage_callback(model)])
+
+
+def get_chat_model(model: str, temperature: float):
+    return _chat_model(model, temperature, get_api_key())
+
+
+def get_chain(key: Hashable, builder: Callable[[], object]):
+    # Chains are immutable once composed, so one instance per key is safe to share across threads
+    key = (key, get_api_key())
+    chain = _chains.get(key)
+    if chain is None:
+        with _chains_lock:
+            chain = _chains.get(key)
+            if chain is None:
+                chain = builder()
+                _chains[key] = chain
+    return chain
@@ -0,0 +1,206 @@
+# Local rule-based outfit composer: fast path and fallback for the LLM stylist
+import os
+import re
+import random
+from itertools import combinations, product
+from typing import Dict, List, Optional, Sequence
+
+from core.retrieval import expand_query, garment_category, score_closet
+
+# Candidates kept per slot before combinations are enumerated; keeps composing O(closet) + a small constant
+CANDIDATES_PER_SLOT = int(os.getenv("COMPOSER_CANDIDATES", "6"))
+
+NEUTRALS = {"black", "white", "grey", "gray", "charcoal", "beige", "cream", "ivory", "navy", "tan", "camel", "khaki", "brown", "taupe", "denim", "nude", "off-white", "stone", "oatmeal", "silver", "gold"}
+
+# Approximate hue angles for common colour words
+HUES = {
+    "red": 0, "burgundy": 345, "maroon": 345, "wine": 345, "coral": 15, "rust": 20, "orange": 30, "terracotta": 20,
+    "mustard": 50, "yellow": 60, "lime": 90, "olive": 80, "green": 120, "emerald": 140, "sage": 110, "mint": 150,
+    "teal": 180, "turquoise": 175, "aqua": 185, "blue": 220, "cobalt": 225, "royal": 225, "sky": 200,
+    "purple": 280, "lavender": 270, "violet": 275, "plum": 300, "magenta": 310, "pink": 330, "fuchsia": 320, "blush": 350,
+}
+
+# Rough formality scale for style words: 0 athletic .. 3 formal
+FORMALITY = {
+    "athletic": 0, "sporty": 0, "activewear": 0, "athleisure": 0, "loungewear": 0,
+    "casual": 1, "streetwear": 1, "bohemian": 1, "relaxed": 1, "grunge": 1, "edgy": 1, "outdoor": 1,
+    "smart": 2, "chic": 2, "preppy": 2, "minimalist": 2, "romantic": 2, "vintage": 2,
+    "business": 3, "formal": 3, "elegant": 3, "tailored": 3, "professional": 3, "evening": 3, "dressy": 3, "cocktail": 3,
+}
+
+SEASON_WORDS = {"spring", "summer", "fall", "autumn", "winter"}
+COLD_WORDS = {"winter", "cold", "snow", "rain", "fall", "autumn", "chilly", "evening"}
+
+_WORD_RE = re.compile(r"[a-z]+(?:-[a-z]+)*")
+
+
+def _words(text) -> List[str]:
+    return _WORD_RE.findall(str(text or "").lower())
+
+
+def color_family(color) -> Optional[object]:
+    # "neutral", a hue angle, or None when the colour is unknown
+    words = _words(color)
+    if "denim" in words:
+        return "neutral"
+    # The first colour word wins: "navy blue" is navy, "olive green" is olive
+    for w in words:
+        if w in NEUTRALS:
+            return "neutral"
+        if w in HUES:
+            return HUES[w]
+    return None
+
+
+def color_harmony(a, b) -> float:
+    fa, fb = color_family(a), color_family(b)
+    if fa is None or fb is None or fa == "neutral" or fb == "neutral":
+        return 1.0
+    diff = abs(fa - fb) % 360
+    diff = min(diff, 360 - diff)
+    if diff <= 20:
+        return 0.85  # monochrome
+    if diff <= 60:
+        return 0.9  # analogous
+    if diff >= 150:
+        return 0.75  # complementary
+    if 100 <= diff <= 140:
+        return 0.5  # triadic
+    return 0.25
+
+
+def formality(item) -> Optional[float]:
+    levels = [FORMALITY[w] for w in _words(item.get("style")) if w in FORMALITY]
+    return sum(levels) / len(levels) if levels else None
+
+
+def _target_formality(user_query: str) -> Optional[float]:
+    terms = expand_query(user_query)
+    levels = [FORMALITY[t] * w for t, w in terms.items() if t in FORMALITY]
+    weights = [w for t, w in terms.items() if t in FORMALITY]
+    return sum(levels) / sum(weights) if weights else None
+
+
+def _season_fit(item, query_seasons: set) -> float:
+    seasons = set(_words(item.get("season")))
+    if not query_seasons or not seasons or "all-season" in seasons or seasons & {"all", "year-round"}:
+        return 0.0
+    return 1.0 if seasons & query_seasons else -1.0
+
+
+def _item_scores(user_query: str, closet_data: Sequence) -> Dict[int, float]:
+    relevance = score_closet(user_query, closet_data)
+    target = _target_formality(user_query)
+    query_seasons = set(_words(user_query)) & SEASON_WORDS
+    scores = {}
+    for pos, item in enumerate(closet_data):
+        score = relevance.get(pos, 0.0)
+        level = formality(item)
+        if target is not None and level is not None:
+            score -= 2.0 * abs(target - level)
+        score += 2.0 * _season_fit(item, query_seasons)
+        scores[pos] = score
+    return scores
+
+
+def _outfit_score(items: List, item_scores: Dict[int, float], positions: List[int]) -> float:
+    base = sum(item_scores[p] for p in positions) / len(positions)
+    pairs = list(combinations(items, 2))
+    harmony = sum(color_harmony(a.get("color"), b.get("color")) for a, b in pairs) / len(pairs) if pairs else 1.0
+    hues = {color_family(i.get("color")) for i in items} - {"neutral", None}
+    clash = max(0, len(hues) - 2) * 0.5
+    levels = [lv for lv in (formality(i) for i in items) if lv is not None]
+    spread = (max(levels) - min(levels)) if len(levels) > 1 else 0.0
+    return base + 4.0 * harmony - clash - 1.5 * spread
+
+
+def compose_outfits(user_query: str, closet_data: Sequence, num_variations: int = 1, seed: Optional[int] = None) -> List[List]:
+    # Returns up to num_variations outfits (lists of items), best first, preferring outfits that share few items
+    if not closet_data:
+        return []
+    rng = random.Random(seed)
+    item_scores = _item_scores(user_query, closet_data)
+    if seed is not None:
+        # Small jitter so different seeds surface different near-equal outfits
+        item_scores = {p: s + rng.uniform(0, 0.5) for p, s in item_scores.items()}
+    slots: Dict[str, List[int]] = {}
+    for pos, item in enumerate(closet_data):
+        slots.setdefault(garment_category(item), []).append(pos)
+    for cat in slots:
+        slots[cat] = sorted(slots[cat], key=lambda p: -item_scores[p])[:CANDIDATES_PER_SLOT]
+
+    cold = bool(set(_words(user_query)) & COLD_WORDS)
+    outer_options = [None] + slots.get("outerwear", [])[:3]
+    shoes = slots.get("shoes") or [None]
+    bases = [(t, b) for t, b in product(slots.get("top", []), slots.get("bottom", []))]
+    bases += [(d,) for d in slots.get("dress", [])]
+    if not bases:
+        # No complete base outfit: fall back to the best single pieces from whatever categories exist
+        bases = [(p,) for cat in ("top", "bottom", "other") for p in slots.get(cat, [])[:2]] or [(max(item_scores, key=item_scores.get),)]
+
+    candidates = []
+    for base, shoe, outer in product(bases, shoes, outer_options):
+        positions = list(base) + [p for p in (shoe, outer) if p is not None]
+        items = [closet_data[p] for p in positions]
+        score = _outfit_score(items, item_scores, positions)
+        if outer is not None:
+            score += 0.5 if cold else -0.25
+        candidates.append((score, positions))
+    candidates.sort(key=lambda c: -c[0])
+
+    chosen: List[List[int]] = []
+    used = set()
+    for _ in range(num_variations):
+        best = None
+        for score, positions in candidates:
+            if positions in chosen:
+                continue
+            adjusted = score - 1.0 * len(used & set(positions))
+            if best is None or adjusted > best[0]:
+                best = (adjusted, positions)
+        if best is None:
+            break
+        chosen.append(best[1])
+        used.update(best[1])
+    return [[closet_data[p] for p in positions] for positions in chosen]
+
+
+def _item_line(item) -> str:
+    label = " ".join(str(v) for v in (item.get("color"), item.get("item_type")) if v)
+    return f"- Item {item.get('id')}: {label}"
+
+
+def styling_notes(user_query: str, outfit: List) -> str:
+    colors = [i.get("color") for i in outfit if i.get("color")]
+    families = {color_family(c) for c in colors} - {None}
+    if families <= {"neutral"}:
+        palette = "A neutral palette keeps the look clean and easy to accessorize."
+    elif "neutral" in families:
+        palette = "Neutral pieces ground the accent colour so it stands out without clashing."
+    else:
+        palette = "The colours sit close together on the colour wheel, so the outfit reads as cohesive."
+    styles = sorted({i.get("style") for i in outfit if i.get("style")})
+    style_line = f"The {' and '.join(styles[:2])} pieces match the tone of {user_query.strip() or 'the occasion'}." if styles else f"These pieces suit {user_query.strip() or 'the occasion'}."
+    anchor = outfit[0]
+    label = " ".join(str(v) for v in (anchor.get("color"), anchor.get("item_type") or "piece") if v)
+    tip = f"Let the {label} lead and keep accessories simple."
+    return f"{palette} {style_line} {tip}"
+
+
+def format_outfit(user_query: str, outfit: List, notes: Optional[str] = None) -> str:
+    lines = "\n".join(_item_line(i) for i in outfit)
+    return f"**Selected Items:**\n{lines}\n\n**Styling Notes:**\n{notes or styling_notes(user_query, outfit)}"
+
+
+def format_outfits(user_query: str, outfits: List[List]) -> str:
+    # Same shape as the LLM response so split_recommendations/parse_recommendation work unchanged
+    if len(outfits) == 1:
+        return format_outfit(user_query, outfits[0])
+    return "\n\n".join(f"=== Recommendation {i} ===\n{format_outfit(user_query, o)}" for i, o in enumerate(outfits, start=1))
+
+
+def compose_recommendation(user_query: str, closet_data: Sequence, num_variations: int = 1, seed: Optional[int] = None) -> str:
+    outfits = compose_outfits(user_query, closet_data, num_variations, seed)
+    if not outfits:
+        return "Error: No closet items to build an outfit from"
+    return format_outfits(user_query, outfits)
@@ -1,30 +1,314 @@
-# JSON I/O for closet data
+# SQLite-backed closet storage
 import os
+import re
 import json
-from typing import List, Dict
+import sqlite3
+import threading
+from types import MappingProxyType
+from typing import List, Dict, Mapping, Optional, Tuple
 
-CLOSET_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'my_closet.json')
-IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'closet_images')
+from core.telemetry import span, timed
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+CLOSET_FILE = os.path.join(ROOT_DIR, 'data', 'my_closet.json')
+CLOSET_DB = os.path.join(ROOT_DIR, 'data', 'my_closet.db')
+IMAGES_DIR = os.path.join(ROOT_DIR, 'data', 'closet_images')
 os.makedirs(IMAGES_DIR, exist_ok=True)
 
-def load_closet_data() -> List[Dict]:
+# Every other user gets data/users/<user_id>/ with its own database and image directory;
+# the default user keeps the original single-closet paths above
+USERS_DIR = os.path.join(ROOT_DIR, 'data', 'users')
+DEFAULT_USER = os.getenv("VARA_DEFAULT_USER", "default")
+USER_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+# Attributes mirrored into their own columns so they can be indexed and filtered in SQL
+INDEXED_FIELDS = ("item_type", "color", "season", "style")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_type TEXT,
+    color TEXT,
+    season TEXT,
+    style TEXT,
+    image_path TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_items_item_type ON items(item_type);
+CREATE INDEX IF NOT EXISTS idx_items_color ON items(color);
+CREATE INDEX IF NOT EXISTS idx_items_season ON items(season);
+CREATE INDEX IF NOT EXISTS idx_items_style ON items(style);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_initialized = set()
+
+
+class _Shard:
+    # One user's closet: database, image directory, parsed-closet cache and write lock
+    def __init__(self, user_id: str, db_path: str, images_dir: str, legacy_file: Optional[str]):
+        self.user_id = user_id
+        self.db_path = db_path
+        self.images_dir = images_dir
+        self.legacy_file = legacy_file
+        # Serializes this user's writers in-process so they don't spin on SQLite's busy timeout
+        self.write_lock = threading.Lock()
+        # Parsed closet shared across Streamlit reruns; refreshed when the database file changes on disk
+        self.cache_lock = threading.Lock()
+        self.cache = {"signature": None, "items": (), "by_id": {}}
+
+
+_shards: Dict[Tuple[str, str], _Shard] = {}
+_shards_lock = threading.Lock()
+
+
+def validate_user_id(user_id: str) -> str:
+    user_id = (user_id or "").strip()
+    if not USER_ID_RE.match(user_id):
+        raise ValueError(f"Invalid user id {user_id!r}; use letters, digits, '.', '_' or '-'")
+    return user_id
+
+
+def _shard(user_id: str = DEFAULT_USER) -> _Shard:
+    user_id = validate_user_id(user_id)
+    if user_id == DEFAULT_USER:
+        db_path, images_dir, legacy_file = CLOSET_DB, IMAGES_DIR, CLOSET_FILE
+    else:
+        user_dir = os.path.join(USERS_DIR, user_id)
+        db_path, images_dir, legacy_file = os.path.join(user_dir, 'my_closet.db'), os.path.join(user_dir, 'closet_images'), None
+    key = (user_id, db_path)
+    shard = _shards.get(key)
+    if shard is None:
+        with _shards_lock:
+            shard = _shards.get(key)
+            if shard is None:
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+                os.makedirs(images_dir, exist_ok=True)
+                shard = _shards[key] = _Shard(user_id, db_path, images_dir, legacy_file)
+    return shard
+
+
+def images_dir(user_id: str = DEFAULT_USER) -> str:
+    return _shard(user_id).images_dir
+
+
+def image_path_for(filename: str, user_id: str = DEFAULT_USER) -> str:
+    # Stored image paths are relative to the repo root, like the ones the app has always written
+    return os.path.relpath(os.path.join(images_dir(user_id), filename), ROOT_DIR)
+
+
+def list_users() -> List[str]:
     try:
-        if os.path.exists(CLOSET_FILE):
-            with open(CLOSET_FILE, "r") as f:
-                return json.load(f)
-        return []
+        names = sorted(n for n in os.listdir(USERS_DIR) if USER_ID_RE.match(n) and os.path.isdir(os.path.join(USERS_DIR, n)))
+    except OSError:
+        names = []
+    return [DEFAULT_USER] + [n for n in names if n != DEFAULT_USER]
+
+
+def _normalize(value) -> Optional[str]:
+    if value is None:
+        return None
+    return str(value).strip().lower()
+
+
+def _row_values(item_dict: dict) -> tuple:
+    # The id lives only in the primary key column and is merged back in by _row_to_item
+    data = {k: v for k, v in item_dict.items() if k != "id"}
+    return tuple(_normalize(item_dict.get(f)) for f in INDEXED_FIELDS) + (item_dict.get("image_path"), json.dumps(data))
+
+
+def _row_to_item(row: tuple) -> Dict:
+    item = json.loads(row[1])
+    item["id"] = row[0]
+    return item
+
+
+def _migrate_json(conn: sqlite3.Connection, legacy_file: Optional[str]) -> None:
+    # One-time import of the legacy my_closet.json; original IDs are kept so image/recommendation references stay valid
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+        return
+    legacy = []
+    if legacy_file and os.path.exists(legacy_file):
+        try:
+            with open(legacy_file, "r") as f:
+                legacy = json.load(f)
+        except Exception:
+            legacy = []
+    items = [dict(item) for item in (legacy if isinstance(legacy, list) else []) if isinstance(item, dict)]
+    # Every unique explicit ID goes in first, so an item needing a fresh ID can't take one that a
+    # later legacy item owns ([0, 1, 1, 2] keeps 0, 1 and 2 and gives the second 1 a new ID)
+    seen = set()
+    needs_id = []
+    for item in items:
+        item_id = item.get("id")
+        if isinstance(item_id, int) and item_id not in seen:
+            conn.execute(
+                "INSERT INTO items (id, item_type, color, season, style, image_path, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (item_id,) + _row_values(item),
+            )
+            seen.add(item_id)
+        else:
+            needs_id.append(item)
+    for item in needs_id:
+        cur = conn.execute(
+            "INSERT INTO items (item_type, color, season, style, image_path, data) VALUES (?, ?, ?, ?, ?, ?)",
+            _row_values(item),
+        )
+        seen.add(cur.lastrowid)
+    conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (str(len(seen)),))
+
+
+def _connect(shard: _Shard) -> sqlite3.Connection:
+    conn = sqlite3.connect(shard.db_path, timeout=30)
+    if shard.db_path not in _initialized:
+        conn.executescript(_SCHEMA)
+        # IMMEDIATE takes the write lock up front so two processes can't both run the migration
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _migrate_json(conn, shard.legacy_file)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        _initialized.add(shard.db_path)
+    return conn
+
+
+def _db_signature(shard: _Shard) -> tuple:
+    try:
+        st = os.stat(shard.db_path)
+        return (shard.db_path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return (shard.db_path, None, None)
+
+
+def _invalidate_cache(user_id: str = DEFAULT_USER) -> None:
+    shard = _shard(user_id)
+    with shard.cache_lock:
+        shard.cache["signature"] = None
+
+
+def get_closet_view(user_id: str = DEFAULT_USER) -> Tuple[Mapping, ...]:
+    shard = _shard(user_id)
+    signature = _db_signature(shard)
+    with shard.cache_lock:
+        if shard.cache["signature"] == signature:
+            return shard.cache["items"]
+    with span("database.refresh_closet_view", user=shard.user_id) as s:
+        try:
+            conn = _connect(shard)
+            try:
+                rows = conn.execute("SELECT id, data FROM items ORDER BY id").fetchall()
+            finally:
+                conn.close()
+        except Exception:
+            return ()
+        items = tuple(MappingProxyType(_row_to_item(r)) for r in rows)
+        s.set(items=len(items))
+    with shard.cache_lock:
+        # The signature taken before the read is stored, so a write that lands mid-read forces another refresh
+        shard.cache["signature"] = signature
+        shard.cache["items"] = items
+        shard.cache["by_id"] = {item["id"]: item for item in items}
+    return items
+
+
+def get_closet_page(offset: int = 0, limit: int = 60, user_id: str = DEFAULT_USER) -> Tuple[Mapping, ...]:
+    # One page of the closet for the grid; served from the parsed view when it is already current,
+    # otherwise straight from SQL so a large closet isn't parsed in full just to draw its first tiles
+    shard = _shard(user_id)
+    signature = _db_signature(shard)
+    with shard.cache_lock:
+        if shard.cache["signature"] == signature:
+            return shard.cache["items"][offset:offset + limit]
+    try:
+        conn = _connect(shard)
+        try:
+            rows = conn.execute("SELECT id, data FROM items ORDER BY id LIMIT ? OFFSET ?", (limit, offset)).fetchall()
+        finally:
+            conn.close()
+    except Exception:
+        return ()
+    return tuple(MappingProxyType(_row_to_item(r)) for r in rows)
+
+
+def count_items(user_id: str = DEFAULT_USER) -> int:
+    shard = _shard(user_id)
+    with shard.cache_lock:
+        if shard.cache["signature"] == _db_signature(shard):
+            return len(shard.cache["items"])
+    try:
+        conn = _connect(shard)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        finally:
+            conn.close()
     except Exception:
+        return 0
+
+
+def get_item(item_id: int, user_id: str = DEFAULT_USER) -> Optional[Mapping]:
+    get_closet_view(user_id)
+    shard = _shard(user_id)
+    with shard.cache_lock:
+        return shard.cache["by_id"].get(item_id)
+
+
+@timed("database.load_closet_data")
+def load_closet_data(user_id: str = DEFAULT_USER) -> List[Dict]:
+    return [dict(item) for item in get_closet_view(user_id)]
+
+
+def find_items(user_id: str = DEFAULT_USER, **filters) -> List[Dict]:
+    clauses = []
+    params = []
+    for field, value in filters.items():
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"Cannot filter on {field!r}; indexed fields are {INDEXED_FIELDS}")
+        clauses.append(f"{field} = ?")
+        params.append(_normalize(value))
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    try:
+        conn = _connect(_shard(user_id))
+        try:
+            rows = conn.execute(f"SELECT id, data FROM items{where} ORDER BY id", params).fetchall()
+        finally:
+            conn.close()
+        return [_row_to_item(r) for r in rows]
+    except sqlite3.Error:
         return []
 
-def save_item(item_dict: dict, image_path: str) -> bool:
+
+@timed("database.save_items")
+def save_items(items: List[tuple], user_id: str = DEFAULT_USER) -> List[int]:
+    # Saves (item_dict, image_path) pairs in a single transaction; returns the new IDs in order
+    shard = _shard(user_id)
+    ids = []
+    with shard.write_lock:
+        conn = _connect(shard)
+        try:
+            with conn:
+                for item_dict, image_path in items:
+                    item_dict = dict(item_dict)
+                    item_dict["image_path"] = image_path
+                    cur = conn.execute(
+                        "INSERT INTO items (item_type, color, season, style, image_path, data) VALUES (?, ?, ?, ?, ?, ?)",
+                        _row_values(item_dict),
+                    )
+                    ids.append(cur.lastrowid)
+        finally:
+            conn.close()
+            _invalidate_cache(shard.user_id)
+    return ids
+
+
+@timed("database.save_item")
+def save_item(item_dict: dict, image_path: str, user_id: str = DEFAULT_USER) -> bool:
     try:
-        closet_data = load_closet_data()
-        item_dict = dict(item_dict)
-        item_dict["image_path"] = image_path
-        item_dict["id"] = len(closet_data)
-        closet_data.append(item_dict)
-        with open(CLOSET_FILE, "w") as f:
-            json.dump(closet_data, f, indent=2)
+        save_items([(item_dict, image_path)], user_id)
         return True
     except Exception:
         return False
@@ -0,0 +1,217 @@
+# Closet pre-filtering so the stylist prompt only carries relevant items
+import os
+import re
+import json
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+from core.telemetry import timed
+
+TOP_K_PER_CATEGORY = int(os.getenv("STYLIST_TOP_K", "8"))
+
+# Fields sent to the model; descriptions and raw analysis blobs stay out of the prompt
+COMPACT_FIELDS = ("id", "item_type", "color", "style", "season", "fit")
+
+# Attribute weights for keyword matches against the query
+FIELD_WEIGHTS = {"item_type": 3.0, "style": 3.0, "season": 2.0, "color": 2.0, "fit": 1.0, "pattern": 1.0, "material": 1.0, "details": 0.5}
+
+CATEGORY_KEYWORDS = {
+    "top": ["shirt", "t-shirt", "tee", "blouse", "top", "sweater", "polo", "tank", "camisole", "sweatshirt", "hoodie", "turtleneck", "henley", "tunic", "bodysuit", "jumper", "pullover"],
+    "bottom": ["jeans", "pants", "trousers", "shorts", "skirt", "chinos", "leggings", "joggers", "slacks", "culottes"],
+    "dress": ["dress", "gown", "jumpsuit", "romper", "playsuit"],
+    "outerwear": ["jacket", "coat", "blazer", "parka", "cardigan", "trench", "vest", "windbreaker", "gilet", "poncho", "overcoat"],
+    "shoes": ["shoes", "shoe", "sneakers", "sneaker", "boots", "boot", "heels", "heel", "loafers", "loafer", "sandals", "sandal", "flats", "oxfords", "pumps", "mules", "trainers", "brogues", "espadrilles"],
+    "accessory": ["bag", "belt", "hat", "scarf", "watch", "tie", "necklace", "earrings", "bracelet", "sunglasses", "cap", "purse", "clutch", "tote", "beanie"],
+}
+
+# Occasion words expanded into the attribute vocabulary the analyzer produces
+OCCASION_HINTS = {
+    "date": ["smart casual", "chic", "evening", "romantic", "fitted"],
+    "dinner": ["smart casual", "chic", "evening", "elegant"],
+    "wedding": ["formal", "elegant", "dressy", "tailored"],
+    "interview": ["business", "formal", "professional", "tailored", "blazer"],
+    "office": ["business casual", "professional", "tailored"],
+    "work": ["business casual", "professional", "tailored"],
+    "meeting": ["business", "professional", "tailored"],
+    "party": ["party", "evening", "chic", "statement"],
+    "club": ["party", "evening", "streetwear", "statement"],
+    "gym": ["athletic", "sporty", "activewear", "sneakers"],
+    "workout": ["athletic", "sporty", "activewear", "sneakers"],
+    "run": ["athletic", "sporty", "sneakers"],
+    "hike": ["outdoor", "athletic", "boots", "relaxed"],
+    "beach": ["summer", "casual", "linen", "shorts", "sandals"],
+    "brunch": ["casual", "smart casual", "spring", "summer"],
+    "travel": ["casual", "comfortable", "relaxed", "sneakers"],
+    "funeral": ["formal", "black", "tailored"],
+    "concert": ["streetwear", "casual", "edgy", "denim"],
+    "winter": ["winter", "wool", "coat", "boots", "knit"],
+    "summer": ["summer", "linen", "cotton", "shorts", "sandals"],
+    "rain": ["waterproof", "boots", "trench", "coat"],
+    "casual": ["casual", "relaxed", "denim"],
+    "formal": ["formal", "elegant", "tailored"],
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+# Indexes of recently seen (immutable) closet views, keyed by identity; one slot per active user closet
+INDEX_MEMO_SIZE = int(os.getenv("STYLIST_INDEX_MEMO_SIZE", "16"))
+_index_memo: "OrderedDict[int, Tuple[Sequence, Dict]]" = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def _tokens(text: str) -> List[str]:
+    return _WORD_RE.findall(str(text or "").lower())
+
+
+def _category_pattern():
+    alternatives = sorted({kw for kws in CATEGORY_KEYWORDS.values() for kw in kws}, key=len, reverse=True)
+    return re.compile(r"\b(" + "|".join(re.escape(a) for a in alternatives) + r")\b")
+
+
+_CATEGORY_RE = _category_pattern()
+_KEYWORD_CATEGORY = {kw: cat for cat, kws in CATEGORY_KEYWORDS.items() for kw in kws}
+
+
+def garment_category(item) -> str:
+    # The head noun usually comes last ("shirt dress" is a dress, "dress shirt" a shirt)
+    matches = _CATEGORY_RE.findall(str(item.get("item_type", "")).lower())
+    if not matches:
+        return "other"
+    return _KEYWORD_CATEGORY[matches[-1]]
+
+
+def compact_item(item) -> Dict:
+    return {f: item[f] for f in COMPACT_FIELDS if item.get(f) not in (None, "")}
+
+
+def expand_query(user_query: str) -> Dict[str, float]:
+    terms: Dict[str, float] = {}
+    for tok in _tokens(user_query):
+        terms[tok] = max(terms.get(tok, 0.0), 1.0)
+        for hint in OCCASION_HINTS.get(tok, ()):
+            for h in _tokens(hint):
+                terms[h] = max(terms.get(h, 0.0), 0.6)
+    return terms
+
+
+def build_closet_index(closet_data: Sequence) -> Dict:
+    postings: Dict[str, Dict[int, float]] = {}
+    categories: Dict[str, List[int]] = {}
+    for pos, item in enumerate(closet_data):
+        categories.setdefault(garment_category(item), []).append(pos)
+        for field, weight in FIELD_WEIGHTS.items():
+            for tok in set(_tokens(item.get(field, ""))):
+                bucket = postings.setdefault(tok, {})
+                bucket[pos] = bucket.get(pos, 0.0) + weight
+    return {"items": closet_data, "postings": postings, "categories": categories}
+
+
+def _get_index(closet_data: Sequence) -> Dict:
+    # Closet views from core.database are cached tuples, so identity is a safe reuse key
+    # (the memo holds the tuple itself, so its id can't be recycled while the entry lives)
+    if not isinstance(closet_data, tuple):
+        return build_closet_index(closet_data)
+    with _index_lock:
+        entry = _index_memo.get(id(closet_data))
+        if entry is not None and entry[0] is closet_data:
+            _index_memo.move_to_end(id(closet_data))
+            return entry[1]
+    index = build_closet_index(closet_data)
+    with _index_lock:
+        _index_memo[id(closet_data)] = (closet_data, index)
+        while len(_index_memo) > INDEX_MEMO_SIZE:
+            _index_memo.popitem(last=False)
+    return index
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+_embedding_memo: Dict[Tuple[int, str], List[float]] = {}
+
+
+def _embedding_scores(user_query: str, items: Sequence, embeddings) -> List[float]:
+    # Any LangChain-style embeddings object (embed_query / embed_documents) works here
+    texts = [json.dumps(compact_item(it)) for it in items]
+    missing = [i for i, t in enumerate(texts) if (id(embeddings), t) not in _embedding_memo]
+    if missing:
+        vectors = embeddings.embed_documents([texts[i] for i in missing])
+        for i, vec in zip(missing, vectors):
+            _embedding_memo[(id(embeddings), texts[i])] = vec
+    q = embeddings.embed_query(user_query)
+    return [_cosine(q, _embedding_memo[(id(embeddings), t)]) for t in texts]
+
+
+def score_closet(user_query: str, closet_data: Sequence, embeddings=None, embedding_weight: float = 5.0) -> Dict[int, float]:
+    # Relevance per closet position; positions with no matching term are absent (score 0)
+    index = _get_index(closet_data)
+    scores: Dict[int, float] = {}
+    for term, qweight in expand_query(user_query).items():
+        for pos, w in index["postings"].get(term, {}).items():
+            scores[pos] = scores.get(pos, 0.0) + qweight * w
+    if embeddings is not None:
+        try:
+            for pos, sim in enumerate(_embedding_scores(user_query, closet_data, embeddings)):
+                scores[pos] = scores.get(pos, 0.0) + embedding_weight * sim
+        except Exception:
+            pass
+    return scores
+
+
+def rank_closet(user_query: str, closet_data: Sequence, top_k: int = TOP_K_PER_CATEGORY, embeddings=None, embedding_weight: float = 5.0) -> List:
+    index = _get_index(closet_data)
+    scores = score_closet(user_query, closet_data, embeddings=embeddings, embedding_weight=embedding_weight)
+    selected = []
+    for positions in index["categories"].values():
+        # Zero-score items still fill the slot so every category stays represented
+        ranked = sorted(positions, key=lambda p: -scores.get(p, 0.0))
+        selected.extend(ranked[:top_k])
+    selected.sort()
+    return [closet_data[p] for p in selected]
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model("gpt-4")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is None:
+        # Rough heuristic when tiktoken is unavailable
+        return max(1, len(text) // 4)
+    return len(enc.encode(text))
+
+
+def _full_closet_tokens(closet_data: Sequence) -> int:
+    # Size of the unfiltered closet as the prompt used to carry it; kept on the memoized index
+    # so it is serialized once per closet view rather than on every request
+    index = _get_index(closet_data)
+    tokens = index.get("tokens_before")
+    if tokens is None:
+        tokens = index["tokens_before"] = count_tokens(json.dumps([dict(it) for it in closet_data], indent=2))
+    return tokens
+
+
+@timed("retrieval.build_closet_context")
+def build_closet_context(user_query: str, closet_data: Sequence, top_k: int = TOP_K_PER_CATEGORY, embeddings=None) -> Tuple[str, Dict]:
+    candidates = rank_closet(user_query, closet_data, top_k=top_k, embeddings=embeddings)
+    context_json = json.dumps([compact_item(it) for it in candidates], separators=(",", ":"))
+    stats = {
+        "items_before": len(closet_data),
+        "items_after": len(candidates),
+        "tokens_before": _full_closet_tokens(closet_data),
+        "tokens_after": count_tokens(context_json),
+    }
+    return context_json, stats
@@ -1,29 +1,78 @@
 # LLM logic for outfit recommendations
 import os
+import re
 import json
+import hashlib
+from functools import lru_cache
+from typing import Generator, Iterator, List, Optional, Tuple
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableLambda
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+from core.cache import cache_get, cache_put, make_key
+from core.clients import get_api_key, get_chain, get_chat_model
+from core.composer import compose_recommendation
+from core.telemetry import span, timed
+from utils.helpers import split_recommendations
+from utils.parser import MARKER_RE, parse_response
 
+STYLIST_MODEL = "gpt-4"
 
-def get_outfit_recommendation(user_query: str, closet_data_json: str, num_variations: int = 1, temperature: float | None = None, seed: int | None = None) -> str:
-    if not OPENAI_API_KEY:
-        return "Error: Missing API key"
-    llm = ChatOpenAI(model="gpt-4", temperature=(0.7 if temperature is None else temperature), api_key=OPENAI_API_KEY)
+RECOMMENDATION_MARKER_RE = MARKER_RE
+VARIATION_CONCURRENCY = int(os.getenv("VARIATION_CONCURRENCY", "5"))
+# "llm": gpt-4 picks the outfits (local composer only as a fallback), "local": rule-based composer only,
+# "hybrid": the composer picks the outfits and the LLM only rewrites their styling notes
+STYLIST_MODE = os.getenv("STYLIST_MODE", "llm")
+
+# Bump RECOMMENDATION_PROMPT_VERSION whenever the stylist prompt changes so cached outfits are not reused
+RECOMMENDATION_PROMPT_VERSION = "1"
+RECOMMENDATION_CACHE_NAMESPACE = "recommendations"
+RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL_HOURS", "24")) * 3600
+RECOMMENDATION_CACHE_MAX_ENTRIES = int(os.getenv("RECOMMENDATION_CACHE_MAX_ENTRIES", "500"))
+
+
+def normalize_query(user_query: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", (user_query or "").lower()))
+
+
+def recommendation_cache_key(user_query: str, closet_data_json: str, num_variations: int = 1, temperature: float | None = None, seed: int | None = None, mode: str = "single") -> str:
+    # The closet version is the hash of the exact closet context sent to the model
+    closet_version = hashlib.sha256(closet_data_json.encode("utf-8")).hexdigest()
+    temperature = 0.7 if temperature is None else temperature
+    return make_key(RECOMMENDATION_PROMPT_VERSION, STYLIST_MODEL, mode, normalize_query(user_query), closet_version, num_variations, temperature, seed)
+
+
+def get_cached_recommendations(key: str) -> Optional[List[str]]:
+    return cache_get(RECOMMENDATION_CACHE_NAMESPACE, key, max_age=RECOMMENDATION_CACHE_TTL)
+
+
+def store_recommendations(key: str, recs) -> None:
+    if not recs or any(str(r).startswith("Error:") for r in (recs if isinstance(recs, list) else [recs])):
+        return
+    cache_put(RECOMMENDATION_CACHE_NAMESPACE, key, recs, max_entries=RECOMMENDATION_CACHE_MAX_ENTRIES)
+
+
+def derive_seed(seed: int | None, index: int) -> int:
+    # Stable per-variation seed: the same (seed, index) always yields the same request
+    digest = hashlib.sha256(f"{0 if seed is None else seed}:{index}".encode("utf-8")).hexdigest()
+    return int(digest[:8], 16)
+
+
+def _multi_instructions(num_variations: int) -> str:
     if num_variations and num_variations > 1:
-        multi_instructions = f"\n\nProvide EXACTLY {num_variations} distinct outfit recommendations. For each recommendation, start with a line like '=== Recommendation [i] ===' (where [i] is 1..{num_variations}) and then include the recommendation content using the exact format below. Separate recommendations clearly."
-    else:
-        multi_instructions = ""
+        return f"\n\nProvide EXACTLY {num_variations} distinct outfit recommendations. For each recommendation, start with a line like '=== Recommendation [i] ===' (where [i] is 1..{num_variations}) and then include the recommendation content using the exact format below. Separate recommendations clearly."
+    return ""
+
 
-    prompt_text = f"""Here is the user's available wardrobe inventory in JSON format:
+@lru_cache(maxsize=1)
+def _stylist_prompt() -> ChatPromptTemplate:
+    prompt_text = """Here is the user's available wardrobe inventory in JSON format:
 
-{{closet_data}}
+{closet_data}
 
-The user asks: {{user_query}}
+The user asks: {user_query}
 
-{{variation}}
+{variation}
 
 Based strictly on the inventory above, suggest a complete outfit.
 
@@ -41,15 +90,237 @@ Use this exact format with "Item [ID]:" for each clothing piece.
 {multi_instructions}
 """
 
-    prompt = ChatPromptTemplate.from_messages([
+    return ChatPromptTemplate.from_messages([
         ("system", "You are a professional fashion stylist."),
         ("human", prompt_text),
     ])
 
-    chain = prompt | llm | StrOutputParser()
 
+def _compose_chain(temperature: float):
+    llm = get_chat_model(STYLIST_MODEL, temperature)
+    prompt = _stylist_prompt()
+    unseeded = prompt | llm
+
+    def with_seed(inputs: dict):
+        # The seed goes to the model's own seed parameter per request, so each batched variation samples differently
+        if inputs.get("seed") is None:
+            return unseeded
+        return prompt | llm.bind(seed=inputs["seed"])
+
+    return RunnableLambda(with_seed) | StrOutputParser()
+
+
+def _build_chain(temperature: float | None = None):
+    # Compiled once per (model, temperature) and reused; the variation count is a prompt input
+    temperature = 0.7 if temperature is None else temperature
+    return get_chain(("stylist", STYLIST_MODEL, temperature), lambda: _compose_chain(temperature))
+
+
+def _chain_inputs(user_query: str, closet_data_json: str, seed: int | None = None, num_variations: int = 1) -> dict:
     variation = ""
     if seed is not None:
         variation = f"Variation hint: Please produce an alternate valid outfit from the same inventory. Variation seed: {seed}."
+    return {"closet_data": closet_data_json, "user_query": user_query, "variation": variation, "multi_instructions": _multi_instructions(num_variations), "seed": seed}
+
+
+POLISH_PROMPT = """The user asks: {user_query}
+
+These outfits were already chosen from the user's wardrobe:
+
+{outfits}
+
+Rewrite only the text under **Styling Notes:** for each outfit so it explains why the colors and styles work together and why the outfit suits the occasion. Keep it concise but informative.
+Keep every '=== Recommendation [i] ===' line and every '- Item [ID]: ...' line exactly as given, and keep the same format.
+"""
+
+
+def _compose_polish_chain(temperature: float):
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "You are a professional fashion stylist."),
+        ("human", POLISH_PROMPT),
+    ])
+    return prompt | get_chat_model(STYLIST_MODEL, temperature) | StrOutputParser()
+
+
+def local_recommendation(user_query: str, closet_data_json: str, num_variations: int = 1, seed: int | None = None) -> str:
+    try:
+        items = json.loads(closet_data_json)
+    except Exception:
+        items = []
+    return compose_recommendation(user_query, items if isinstance(items, list) else [], num_variations, seed)
+
+
+def polish_recommendation(user_query: str, draft: str, temperature: float | None = None) -> str:
+    # Falls back to the draft when the model is unavailable or changes the selected items
+    if not get_api_key():
+        return draft
+    temperature = 0.7 if temperature is None else temperature
+    chain = get_chain(("polish", STYLIST_MODEL, temperature), lambda: _compose_polish_chain(temperature))
+    try:
+        polished = chain.invoke({"user_query": user_query, "outfits": draft})
+    except Exception:
+        return draft
+    same_items = [sorted(r.item_ids) for r in parse_response(polished)] == [sorted(r.item_ids) for r in parse_response(draft)]
+    return polished if same_items else draft
+
+
+@timed("stylist.get_outfit_recommendation")
+def get_outfit_recommendation(user_query: str, closet_data_json: str, num_variations: int = 1, temperature: float | None = None, seed: int | None = None, use_cache: bool = True, mode: str | None = None) -> str:
+    # use_cache=False skips the lookup (for "give me something new") but still refreshes the cached entry
+    return get_outfit_recommendation_with_source(user_query, closet_data_json, num_variations, temperature, seed, use_cache, mode)[0]
+
+
+def get_outfit_recommendation_with_source(user_query: str, closet_data_json: str, num_variations: int = 1, temperature: float | None = None, seed: int | None = None, use_cache: bool = True, mode: str | None = None) -> Tuple[str, str]:
+    # Same as get_outfit_recommendation, plus where the outfits came from: "model", "cache" or
+    # "local" (the composer, either requested with mode="local" or as the fallback for a failed model call)
+    mode = mode or STYLIST_MODE
+    if mode == "local":
+        return local_recommendation(user_query, closet_data_json, num_variations, seed), "local"
+    key = recommendation_cache_key(user_query, closet_data_json, num_variations, temperature, seed, mode=f"raw:{mode}")
+    if use_cache:
+        cached = get_cached_recommendations(key)
+        if cached is not None:
+            return cached, "cache"
+    if not get_api_key():
+        return local_recommendation(user_query, closet_data_json, num_variations, seed), "local"
+    if mode == "hybrid":
+        draft = local_recommendation(user_query, closet_data_json, num_variations, seed)
+        raw = polish_recommendation(user_query, draft, temperature)
+        if raw is draft:
+            return draft, "local"
+    else:
+        try:
+            chain = _build_chain(temperature)
+            with span("stylist.model_call", model=STYLIST_MODEL, variations=num_variations):
+                raw = chain.invoke(_chain_inputs(user_query, closet_data_json, seed, num_variations))
+        except Exception:
+            # Locally composed outfits are returned but never cached, so the next call retries the model
+            return local_recommendation(user_query, closet_data_json, num_variations, seed), "local"
+    store_recommendations(key, raw)
+    return raw, "model"
+
+
+def stream_outfit_recommendations(user_query: str, closet_data_json: str, num_variations: int = 1, temperature: float | None = None, seed: int | None = None) -> Generator[str, None, Optional[str]]:
+    # Yields each recommendation's text as soon as the next '=== Recommendation [i] ===' marker
+    # (or the end of the stream) shows it is complete; output feeds parse_recommendation unchanged.
+    # Yields nothing when the model is unavailable, so callers can fall back to local_recommendation.
+    # Returns the full raw response when the stream finished, None when it was cut short
+    if not get_api_key():
+        return None
+    chain = _build_chain(temperature)
+    raw = ""
+    buffer = ""
+    seen_marker = False
+    chunks = chain.stream(_chain_inputs(user_query, closet_data_json, seed, num_variations))
+    while True:
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            break
+        except Exception:
+            # Keep what was completed before the failure; the unfinished tail is dropped
+            return None
+        raw += chunk
+        buffer += chunk
+        markers = list(RECOMMENDATION_MARKER_RE.finditer(buffer))
+        if not markers:
+            continue
+        if not seen_marker:
+            # Drop any preamble before the first marker
+            seen_marker = True
+            buffer = buffer[markers[0].start():]
+            markers = list(RECOMMENDATION_MARKER_RE.finditer(buffer))
+        for current, following in zip(markers, markers[1:]):
+            rec = buffer[current.end():following.start()].strip()
+            if rec:
+                yield rec
+        buffer = buffer[markers[-1].start():]
+    if seen_marker:
+        tail = RECOMMENDATION_MARKER_RE.sub("", buffer, count=1).strip()
+        if tail:
+            yield tail
+    else:
+        yield from split_recommendations(buffer)
+    return raw
+
+
+def iter_recommendations(user_query: str, closet_data_json: str, num_variations: int = 1, temperature: float | None = None, seed: int | None = None, use_cache: bool = True, mode: str | None = None, variation_mode: str = "single") -> Iterator[Tuple[int, str]]:
+    # Yields (index, text) as outfits arrive, with caching handled here for every mode:
+    # "single" streams one completion and shares get_outfit_recommendation's cache entry;
+    # "parallel" shares get_outfit_variations' entry. Only complete result sets are cached.
+    # use_cache=False skips the lookup and sends `seed`, but stores under the seed-less key
+    # so "something new" replaces the cached answer for the question.
+    # Yields nothing when the model is unavailable, so callers can fall back to local_recommendation
+    mode = mode or STYLIST_MODE
+    if mode != "llm":
+        yield from enumerate(split_recommendations(get_outfit_recommendation(user_query, closet_data_json, num_variations, temperature, seed, use_cache, mode)))
+        return
+    key_seed = seed if use_cache else None
+    if variation_mode == "parallel":
+        key = recommendation_cache_key(user_query, closet_data_json, num_variations, temperature, key_seed, mode="parallel:0")
+        cached = get_cached_recommendations(key) if use_cache else None
+        if cached is not None:
+            yield from enumerate(cached)
+            return
+        results = {}
+        for i, rec in iter_outfit_variations(user_query, closet_data_json, num_variations, temperature, seed):
+            results[i] = rec
+            yield i, rec
+        if len(results) == num_variations:
+            store_recommendations(key, [results[i] for i in sorted(results)])
+        return
+    key = recommendation_cache_key(user_query, closet_data_json, num_variations, temperature, key_seed, mode="raw:llm")
+    cached = get_cached_recommendations(key) if use_cache else None
+    if cached is not None:
+        yield from enumerate(split_recommendations(cached))
+        return
+    recs = []
+    stream = stream_outfit_recommendations(user_query, closet_data_json, num_variations, temperature, seed)
+    while True:
+        try:
+            rec = next(stream)
+        except StopIteration as stop:
+            raw = stop.value
+            break
+        yield len(recs), rec
+        recs.append(rec)
+    # A stream that was cut short, or answered with fewer outfits than asked, is not cached
+    if raw is not None and len(recs) == num_variations:
+        store_recommendations(key, raw)
+
+
+def iter_outfit_variations(user_query: str, closet_data_json: str, num_variations: int = 1, temperature: float | None = None, seed: int | None = None, start_index: int = 0, max_concurrency: int = VARIATION_CONCURRENCY) -> Iterator[Tuple[int, str]]:
+    # One small single-outfit request per variation, run concurrently; yields (index, text) in completion
+    # order and skips variations whose request failed so the others are still usable
+    if not get_api_key():
+        return
+    chain = _build_chain(temperature)
+    inputs = [_chain_inputs(user_query, closet_data_json, derive_seed(seed, start_index + i)) for i in range(num_variations)]
+    for i, result in chain.batch_as_completed(inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True):
+        if isinstance(result, Exception) or not str(result).strip():
+            continue
+        yield start_index + i, str(result).strip()
+
+
+@timed("stylist.get_outfit_variations")
+def get_outfit_variations(user_query: str, closet_data_json: str, num_variations: int = 1, temperature: float | None = None, seed: int | None = None, start_index: int = 0, max_concurrency: int = VARIATION_CONCURRENCY, use_cache: bool = True) -> List[str]:
+    return get_outfit_variations_with_source(user_query, closet_data_json, num_variations, temperature, seed, start_index, max_concurrency, use_cache)[0]
+
 
-    return chain.invoke({"closet_data": closet_data_json, "user_query": user_query, "variation": variation})
+def get_outfit_variations_with_source(user_query: str, closet_data_json: str, num_variations: int = 1, temperature: float | None = None, seed: int | None = None, start_index: int = 0, max_concurrency: int = VARIATION_CONCURRENCY, use_cache: bool = True) -> Tuple[List[str], str]:
+    # Source is "model", "cache" or "local" as in get_outfit_recommendation_with_source
+    key = recommendation_cache_key(user_query, closet_data_json, num_variations, temperature, seed, mode=f"parallel:{start_index}")
+    if use_cache:
+        cached = get_cached_recommendations(key)
+        if cached is not None:
+            return cached, "cache"
+    results = dict(iter_outfit_variations(user_query, closet_data_json, num_variations, temperature, seed, start_index, max_concurrency))
+    if not results:
+        # Model unavailable: uncached local outfits; composing start_index extra keeps rerolls distinct
+        local = split_recommendations(local_recommendation(user_query, closet_data_json, start_index + num_variations, seed))
+        return local[start_index:] or local[-1:], "local"
+    recs = [results[i] for i in sorted(results)]
+    # Partial batches are returned but not cached, so a later request can fill them in
+    if len(recs) == num_variations:
+        store_recommendations(key, recs)
+    return recs, "model"
@@ -0,0 +1,322 @@
+# Lightweight spans, model usage and cost metrics for the hot paths
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Deque, Dict, List, Optional, Tuple
+
+TELEMETRY_ENABLED = os.getenv("VARA_TELEMETRY", "1") != "0"
+# JSONL file that every finished span and model call is appended to (off when empty)
+TELEMETRY_LOG = os.getenv("VARA_TELEMETRY_LOG", "")
+# Port for a Prometheus text endpoint at /metrics (off when 0)
+METRICS_PORT = int(os.getenv("VARA_METRICS_PORT", "0"))
+RECENT_SPANS = int(os.getenv("VARA_TELEMETRY_RECENT", "500"))
+
+# USD per 1M (input, output) tokens; models missing here are counted but not priced
+MODEL_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+}
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple], float] = {}
+_histograms: Dict[Tuple[str, Tuple], Dict] = {}
+_recent: Deque[Dict] = deque(maxlen=RECENT_SPANS)
+# Open spans of the current context; contextvars (unlike thread locals) follow work handed to
+# executors that copy the context, as LangChain's batch helpers and analyze_clothing_batch do
+_span_stack: contextvars.ContextVar[Tuple["Span", ...]] = contextvars.ContextVar("vara_span_stack", default=())
+_log_file = None
+_server = None
+
+_HELP = {
+    "vara_span_seconds": "Wall time of instrumented operations",
+    "vara_model_latency_seconds": "Model call latency as seen by the client",
+    "vara_model_calls_total": "Model calls",
+    "vara_tokens_total": "Tokens reported by the API",
+    "vara_cost_usd_total": "Estimated model spend in USD",
+    "vara_span_errors_total": "Instrumented operations that raised",
+}
+
+
+def _labels(labels: Dict) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    key = (name, _labels(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                hist["buckets"][i] += 1
+        hist["sum"] += value
+        hist["count"] += 1
+
+
+def _emit(event: Dict) -> None:
+    global _log_file
+    if not TELEMETRY_LOG:
+        return
+    line = json.dumps(event, default=str) + "\n"
+    with _lock:
+        try:
+            if _log_file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(TELEMETRY_LOG)), exist_ok=True)
+                _log_file = open(TELEMETRY_LOG, "a", buffering=1)
+            _log_file.write(line)
+        except OSError:
+            pass
+
+
+class Span:
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "start", "duration")
+
+    def __init__(self, name: str, attrs: Dict, parent: Optional["Span"]):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time()
+        self.duration = 0.0
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+
+def current_span() -> Optional[Span]:
+    stack = _span_stack.get()
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    # Times the block, nests under the enclosing span of this context and records it once finished
+    if not TELEMETRY_ENABLED:
+        yield Span(name, attrs, None)
+        return
+    stack = _span_stack.get()
+    s = Span(name, attrs, stack[-1] if stack else None)
+    token = _span_stack.set(stack + (s,))
+    started = time.perf_counter()
+    error = None
+    try:
+        yield s
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        s.duration = time.perf_counter() - started
+        try:
+            _span_stack.reset(token)
+        except ValueError:
+            # Closed from another context (e.g. a generator finished elsewhere)
+            _span_stack.set(stack)
+        observe("vara_span_seconds", s.duration, span=name)
+        if error:
+            inc("vara_span_errors_total", span=name)
+        event = {
+            "type": "span", "name": name, "trace_id": s.trace_id, "span_id": s.span_id, "parent_id": s.parent_id,
+            "start": s.start, "duration_ms": round(s.duration * 1000, 3), "attrs": s.attrs,
+        }
+        if error:
+            event["error"] = error
+        with _lock:
+            _recent.append(event)
+        _emit(event)
+
+
+def timed(name: Optional[str] = None):
+    # Decorator form of span(); defaults to module.function as the span name
+    def decorate(fn):
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    prices = MODEL_PRICES.get(model)
+    if not prices:
+        return None
+    return (input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
+
+
+def record_usage(model: str, input_tokens: int = 0, output_tokens: int = 0, latency: Optional[float] = None, operation: str = "") -> None:
+    if not TELEMETRY_ENABLED:
+        return
+    input_tokens, output_tokens = int(input_tokens or 0), int(output_tokens or 0)
+    cost = estimate_cost(model, input_tokens, output_tokens)
+    inc("vara_model_calls_total", model=model, operation=operation)
+    inc("vara_tokens_total", input_tokens, model=model, kind="input")
+    inc("vara_tokens_total", output_tokens, model=model, kind="output")
+    if cost is not None:
+        inc("vara_cost_usd_total", cost, model=model)
+    if latency is not None:
+        observe("vara_model_latency_seconds", latency, model=model, operation=operation)
+    parent = current_span()
+    if parent is not None:
+        # Summed on the enclosing span so a request's debug view shows its own tokens and cost;
+        # locked because worker threads of one request all add to the same span
+        with _lock:
+            parent.attrs["input_tokens"] = parent.attrs.get("input_tokens", 0) + input_tokens
+            parent.attrs["output_tokens"] = parent.attrs.get("output_tokens", 0) + output_tokens
+            if cost is not None:
+                parent.attrs["cost_usd"] = round(parent.attrs.get("cost_usd", 0.0) + cost, 6)
+    _emit({
+        "type": "model_call", "model": model, "operation": operation, "time": time.time(),
+        "input_tokens": input_tokens, "output_tokens": output_tokens,
+        "latency_ms": round(latency * 1000, 3) if latency is not None else None, "cost_usd": cost,
+        "trace_id": parent.trace_id if parent else None,
+    })
+
+
+def usage_callback(model: str, operation: str = "stylist"):
+    # LangChain callback that reads token usage off each chat model result (streamed or not)
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class UsageCallback(BaseCallbackHandler):
+        # Inline so usage lands on the current span of the context that made the call
+        run_inline = True
+
+        def __init__(self):
+            self._starts: Dict = {}
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self._starts[run_id] = time.perf_counter()
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._starts[run_id] = time.perf_counter()
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            started = self._starts.pop(run_id, None)
+            latency = time.perf_counter() - started if started is not None else None
+            input_tokens = output_tokens = 0
+            for generations in response.generations:
+                for gen in generations:
+                    usage = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+            if not (input_tokens or output_tokens):
+                usage = (response.llm_output or {}).get("token_usage") or {}
+                input_tokens, output_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+            record_usage(model, input_tokens, output_tokens, latency, operation)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._starts.pop(run_id, None)
+            inc("vara_model_errors_total", model=model, operation=operation)
+
+    return UsageCallback()
+
+
+def recent_spans(trace_id: Optional[str] = None, limit: int = 100) -> List[Dict]:
+    with _lock:
+        spans = list(_recent)
+    if trace_id:
+        spans = [s for s in spans if s["trace_id"] == trace_id]
+    return spans[-limit:]
+
+
+def usage_totals() -> Dict[str, float]:
+    totals = {"model_calls": 0.0, "input_tokens": 0.0, "output_tokens": 0.0, "cost_usd": 0.0}
+    with _lock:
+        for (name, labels), value in _counters.items():
+            kind = dict(labels).get("kind")
+            if name == "vara_model_calls_total":
+                totals["model_calls"] += value
+            elif name == "vara_tokens_total":
+                totals[f"{kind}_tokens"] += value
+            elif name == "vara_cost_usd_total":
+                totals["cost_usd"] += value
+    return totals
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus() -> str:
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, {"buckets": list(v["buckets"]), "sum": v["sum"], "count": v["count"]}) for k, v in _histograms.items())
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), hist in histograms:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+        for bound, count in zip(BUCKETS, hist["buckets"]):
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', str(bound)),))} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {hist['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {hist['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {hist['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1"):
+    # Serves render_prometheus() at /metrics on a daemon thread; safe to call more than once
+    global _server
+    if not port or _server is not None:
+        return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError:
+                # Port taken, e.g. by another Streamlit worker already serving the endpoint
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
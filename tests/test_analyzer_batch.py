@@ -0,0 +1,158 @@
+# analyze_clothing_batch against a local stub client in place of OpenAI
+import base64
+import json
+import threading
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import core.analyzer as analyzer
+from core.analyzer import FALLBACK_ANALYSIS, analyze_clothing_batch
+
+
+def _prepared(name: str) -> dict:
+    # Already-prepared images pass straight through prepare_image; the bytes identify the item
+    return {"image": None, "bytes": name.encode("utf-8"), "mime": "image/jpeg", "ext": ".jpg"}
+
+
+def _rate_limit_error() -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/responses")
+    return openai.RateLimitError("rate limited", response=httpx.Response(429, request=request), body=None)
+
+
+class StubClient:
+    # Mimics client.with_options(...).responses.create(...); behaviour(name, attempt) returns text or raises
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.responses = self
+
+    def with_options(self, **kwargs):
+        return self
+
+    def create(self, model=None, input=None, **kwargs):
+        image_url = input[0]["content"][1]["image_url"]
+        name = base64.b64decode(image_url.split(",", 1)[1]).decode("utf-8")
+        with self.lock:
+            attempt = self.calls.get(name, 0)
+            self.calls[name] = attempt + 1
+        return SimpleNamespace(output_text=self.behaviour(name, attempt), usage=None)
+
+
+def _answer(name: str) -> str:
+    return json.dumps({"item_type": name})
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(analyzer.time, "sleep", recorded.append)
+    return recorded
+
+
+def test_results_keep_input_order_when_items_finish_out_of_order():
+    names = ["first", "second", "third"]
+    release = {name: threading.Event() for name in names}
+
+    def behaviour(name, attempt):
+        # Finish in reverse order: each item waits until the one after it has been reported
+        release[name].wait(timeout=5)
+        return _answer(name)
+
+    def on_progress(done, total, idx):
+        finished.append(idx)
+        if idx > 0:
+            release[names[idx - 1]].set()
+
+    release["third"].set()
+    finished = []
+    results = analyze_clothing_batch(
+        [_prepared(n) for n in names],
+        max_workers=3,
+        api_client=StubClient(behaviour),
+        use_cache=False,
+        on_progress=on_progress,
+    )
+    assert finished == [2, 1, 0]
+    assert results == [_answer(n) for n in names]
+
+
+def test_rate_limit_is_retried_with_backoff(sleeps):
+    def behaviour(name, attempt):
+        if attempt < 2:
+            raise _rate_limit_error()
+        return _answer(name)
+
+    client = StubClient(behaviour)
+    results = analyze_clothing_batch([_prepared("shirt")], max_retries=3, backoff=1.0, api_client=client, use_cache=False)
+    assert results == [_answer("shirt")]
+    assert client.calls["shirt"] == 3
+    # Exponential backoff with up to one backoff unit of jitter
+    assert len(sleeps) == 2
+    assert 1.0 <= sleeps[0] < 2.0
+    assert 2.0 <= sleeps[1] < 3.0
+
+
+def test_exhausted_retries_fall_back(sleeps):
+    def behaviour(name, attempt):
+        if name == "bad":
+            raise _rate_limit_error()
+        return _answer(name)
+
+    client = StubClient(behaviour)
+    results = analyze_clothing_batch([_prepared("good"), _prepared("bad")], max_retries=2, api_client=client, use_cache=False)
+    assert results == [_answer("good"), FALLBACK_ANALYSIS]
+    assert client.calls["bad"] == 3
+    assert len(sleeps) == 2
+
+
+def test_on_progress_called_once_per_item(sleeps):
+    def behaviour(name, attempt):
+        if name == "flaky" and attempt == 0:
+            raise _rate_limit_error()
+        if name == "broken":
+            raise RuntimeError("boom")
+        return _answer(name)
+
+    names = ["a", "flaky", "broken", "b"]
+    calls = []
+    analyze_clothing_batch(
+        [_prepared(n) for n in names],
+        api_client=StubClient(behaviour),
+        use_cache=False,
+        on_progress=lambda done, total, idx: calls.append((done, total, idx)),
+    )
+    assert sorted(idx for _, _, idx in calls) == [0, 1, 2, 3]
+    assert [done for done, _, _ in calls] == [1, 2, 3, 4]
+    assert all(total == len(names) for _, total, _ in calls)
+
+
+def test_durations_are_per_request():
+    def behaviour(name, attempt):
+        analyzer.time.sleep(0.05 if name == "slow" else 0.0)
+        return _answer(name)
+
+    durations = []
+    analyze_clothing_batch([_prepared("slow"), _prepared("fast")], max_workers=1, api_client=StubClient(behaviour), use_cache=False, durations=durations)
+    # With one worker the fast item queues behind the slow one; that wait is not part of its duration
+    assert len(durations) == 2
+    assert durations[0] >= 0.05
+    assert durations[1] < 0.04
+
+
+def test_worker_usage_lands_on_the_batch_span():
+    from core import telemetry
+
+    class UsageClient(StubClient):
+        def create(self, **kwargs):
+            response = super().create(**kwargs)
+            response.usage = SimpleNamespace(input_tokens=10, output_tokens=5)
+            return response
+
+    analyze_clothing_batch([_prepared("a"), _prepared("b")], api_client=UsageClient(lambda name, attempt: _answer(name)), use_cache=False)
+    batch_span = [s for s in telemetry.recent_spans() if s["name"] == "analyzer.analyze_clothing_batch"][-1]
+    assert batch_span["attrs"]["input_tokens"] == 20
+    assert batch_span["attrs"]["output_tokens"] == 10
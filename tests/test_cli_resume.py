@@ -0,0 +1,54 @@
+# vara_cli recommend --resume: only occasions with real model results count as done
+import json
+
+import pytest
+
+import vara_cli
+
+OUTFIT = "**Selected Items:**\n- Item 1: blue shirt\n**Styling Notes:** Easy."
+CLOSET = ({"id": 1, "item_type": "shirt", "color": "blue"},)
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    occasions = tmp_path / "occasions.txt"
+    occasions.write_text("works\nraises\nfalls back\n")
+    output = tmp_path / "out.jsonl"
+    calls = []
+    monkeypatch.setattr(vara_cli, "get_closet_view", lambda user: CLOSET)
+
+    def recommend(occasion, *args, **kwargs):
+        calls.append(occasion)
+        if behaviour.get(occasion) == "raise":
+            raise RuntimeError("rate limited")
+        return OUTFIT, behaviour.get(occasion, "model")
+
+    behaviour = {"raises": "raise", "falls back": "local"}
+    monkeypatch.setattr(vara_cli, "get_outfit_recommendation_with_source", recommend)
+
+    def invoke(*extra):
+        calls.clear()
+        code = vara_cli.main(["recommend", str(occasions), "-o", str(output), "--mode", "llm", "-w", "1", *extra])
+        rows = [json.loads(line) for line in output.read_text().splitlines()]
+        return code, sorted(calls), rows
+
+    invoke.behaviour = behaviour
+    return invoke
+
+
+def test_failed_and_fallback_rows_are_retried_on_resume(run):
+    code, calls, rows = run()
+    assert code == 1
+    assert calls == ["falls back", "raises", "works"]
+    by_occasion = {row["occasion"]: row for row in rows}
+    assert by_occasion["works"]["source"] == "model" and not by_occasion["works"]["fallback"]
+    assert by_occasion["falls back"]["fallback"] is True
+    assert "error" in by_occasion["raises"]
+
+    run.behaviour.clear()
+    code, calls, rows = run("--resume")
+    assert code == 0
+    assert calls == ["falls back", "raises"]
+
+    code, calls, _ = run("--resume")
+    assert calls == []
@@ -0,0 +1,46 @@
+# One-time import of the legacy my_closet.json into SQLite
+import json
+
+import pytest
+
+import core.database as database
+
+
+@pytest.fixture
+def legacy_closet(tmp_path, monkeypatch):
+    legacy = tmp_path / "my_closet.json"
+    legacy.write_text(json.dumps([
+        {"id": 0, "item_type": "shirt"},
+        {"id": 1, "item_type": "jeans"},
+        {"id": 1, "item_type": "duplicate jacket"},
+        {"id": 2, "item_type": "sneakers"},
+        {"item_type": "scarf without id"},
+    ]))
+    monkeypatch.setattr(database, "CLOSET_FILE", str(legacy))
+    monkeypatch.setattr(database, "CLOSET_DB", str(tmp_path / "my_closet.db"))
+    monkeypatch.setattr(database, "IMAGES_DIR", str(tmp_path / "closet_images"))
+    return legacy
+
+
+def _ids_by_type():
+    return {item["item_type"]: item["id"] for item in database.load_closet_data()}
+
+
+def test_unique_legacy_ids_are_kept_and_the_rest_get_fresh_ids(legacy_closet):
+    ids = _ids_by_type()
+    assert ids["shirt"] == 0
+    assert ids["jeans"] == 1
+    assert ids["sneakers"] == 2
+    assert ids["duplicate jacket"] > 2
+    assert ids["scarf without id"] > 2
+    assert ids["duplicate jacket"] != ids["scarf without id"]
+
+
+def test_migration_runs_once(legacy_closet):
+    first = _ids_by_type()
+    # A new process opening the same database must not import the legacy file again
+    database._initialized.discard(database.CLOSET_DB)
+    database._invalidate_cache()
+    legacy_closet.write_text(json.dumps([{"id": 7, "item_type": "added later"}]))
+    assert _ids_by_type() == first
+    assert len(database.load_closet_data()) == 5
@@ -0,0 +1,34 @@
+# Stylist response parsing, including responses without '=== Recommendation [i] ===' markers
+from utils.helpers import split_recommendations
+from utils.parser import parse_response
+
+NUMBERED = """Here are two outfits:
+
+1. **Selected Items:**
+- Item 3: blue shirt
+- Item 4: dark jeans
+**Styling Notes:** Relaxed and clean.
+
+2. **Selected Items:**
+- Item 5: black dress
+**Styling Notes:** Simple and elegant.
+"""
+
+
+def test_markers_split_recommendations():
+    raw = (
+        "=== Recommendation 1 ===\n**Selected Items:**\n- Item 1: white tee\n**Styling Notes:** Easy.\n"
+        "=== Recommendation 2 ===\n**Selected Items:**\n- Item 2: grey hoodie\n**Styling Notes:** Cosy.\n"
+    )
+    assert [rec.item_ids for rec in parse_response(raw)] == [[1], [2]]
+
+
+def test_numbered_outfits_split_without_markers():
+    recs = parse_response(NUMBERED)
+    assert [rec.item_ids for rec in recs] == [[3, 4], [5]]
+    assert all(not rec.errors for rec in recs)
+
+
+def test_numbered_tips_stay_in_one_outfit():
+    raw = "**Selected Items:**\n- Item 3: blue shirt\n**Styling Notes:**\n1. Roll the sleeves.\n2. Tuck it in.\n"
+    assert split_recommendations(raw) == [raw.strip()]
@@ -1,45 +1,67 @@
 # Helper functions for image encoding and parsing
 import os
 import base64
-import re
 import html
+import json
+from functools import lru_cache
 
-def img_to_b64_data_uri(path: str) -> str:
+from core.telemetry import timed
+from utils.parser import parse_one, parse_response
+
+MIME_TYPES = {".png": "image/png", ".webp": "image/webp"}
+
+@lru_cache(maxsize=int(os.getenv("DATA_URI_CACHE_SIZE", "512")))
+def _cached_data_uri(path: str, mtime_ns: int, size: int) -> str:
+    # mtime/size are part of the cache key so an overwritten file is re-encoded
     with open(path, "rb") as f:
         b = f.read()
     ext = os.path.splitext(path)[1].lower()
-    mime = "image/png" if ext == ".png" else "image/jpeg"
+    mime = MIME_TYPES.get(ext, "image/jpeg")
     return f"data:{mime};base64,{base64.b64encode(b).decode('utf-8')}"
 
+def img_to_b64_data_uri(path: str) -> str:
+    st = os.stat(path)
+    return _cached_data_uri(path, st.st_mtime_ns, st.st_size)
+
+@timed("render.closet_grid_html")
+def closet_grid_html(closet_data, image_src=img_to_b64_data_uri) -> str:
+    # image_src maps an image path to an <img> src (a data URI by default, thumbnail_src in the app)
+    tiles = []
+    for it in closet_data:
+        p = it.get("image_path")
+        item_type = it.get("item_type", "")
+        color = it.get("color", "")
+        if p and os.path.exists(p):
+            uri = image_src(p)
+            meta = html.escape((item_type + (" • " + color) if item_type or color else "").strip())
+            tiles.append(
+                f"<div class='closet-card'>"
+                f"<img src='{uri}' alt='item'/>"
+                f"<div class='closet-caption'>"
+                f"<div class='meta'>{meta}</div>"
+                f"</div></div>"
+            )
+    return f"<div class='closet-grid'>{''.join(tiles)}</div>"
+
 def split_recommendations(raw: str) -> list:
-    if not raw or not isinstance(raw, str):
-        return []
-    parts = re.split(r"===\s*Recommendation\s*\d+\s*===", raw)
-    parts = [p.strip() for p in parts if p and p.strip()]
-    if parts:
-        return parts
-    fallback = re.split(r"\n\s*\d+\s*[\.)]", raw)
-    fallback = [p.strip() for p in fallback if p and p.strip()]
-    return fallback if fallback else [raw.strip()]
+    return [rec.text for rec in parse_response(raw)]
 
 def parse_recommendation(rec_text: str):
+    # Legacy (item labels, notes) view over utils.parser.parse_one
     if not rec_text:
         return [], ""
-    rec = re.sub(r"\s+", " ", rec_text).strip()
-    sel_items = []
-    st_match = ""
-    sel_match = re.search(r"\*{0,2}\s*Selected Items:\s*\*{0,2}(.*?)(\*{0,2}\s*Styling Notes:|$)", rec, flags=re.IGNORECASE)
-    if sel_match:
-        items_blob = sel_match.group(1).strip()
-        parts = re.split(r"(?:-\s*Item\s*\d+:|-)+\s*", items_blob)
-        sel_items = [p.strip() for p in parts if p.strip()]
-    st_match = re.search(r"\*{0,2}\s*Styling Notes:\s*\*{0,2}(.*)", rec, flags=re.IGNORECASE)
-    if st_match:
-        styling_blob = st_match.group(1).strip()
-    else:
-        styling_blob = rec[len(sel_match.group(0)):] if sel_match else rec
-    sentences = re.split(r"(?<=[.!?])\s+", styling_blob)
-    short = " ".join(sentences[:]).strip()
-    if not short:
-        short = (styling_blob[:220] + "...") if len(styling_blob) > 220 else styling_blob
-    return sel_items, short
+    rec = parse_one(rec_text)
+    return [i.label for i in rec.items], " ".join(rec.notes.split())
+
+def parse_analysis(result: str):
+    try:
+        return json.loads(result)
+    except Exception:
+        start = result.find("{")
+        end = result.rfind("}")
+        if start != -1 and end != -1 and end > start:
+            try:
+                return json.loads(result[start : end + 1])
+            except Exception:
+                return None
+    return None
@@ -0,0 +1,95 @@
+# Image pre-processing shared by clothing analysis and the stored closet copy
+import io
+import os
+import hashlib
+import threading
+from PIL import Image, ImageChops, ImageOps
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1600"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_AUTO_CROP = os.getenv("IMAGE_AUTO_CROP", "0") == "1"
+
+FORMAT_INFO = {"JPEG": ("image/jpeg", ".jpg"), "WEBP": ("image/webp", ".webp")}
+
+
+def _read_source(source):
+    # Returns (PIL image, size of the bytes we were given); PIL sources are measured as the old path sent them
+    if isinstance(source, Image.Image):
+        buf = io.BytesIO()
+        source.save(buf, format=source.format or "PNG")
+        return source, buf.tell()
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    else:
+        data = source.read()
+        if hasattr(source, "seek"):
+            source.seek(0)
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img, len(data)
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def autocrop_background(img: Image.Image, tolerance: int = 24, margin: float = 0.03) -> Image.Image:
+    # Treat the top-left pixel colour as background and crop to everything that differs from it
+    background = Image.new(img.mode, img.size, img.getpixel((0, 0)))
+    diff = ImageChops.difference(img, background).convert("L").point(lambda v: 255 if v > tolerance else 0)
+    bbox = diff.getbbox()
+    if not bbox:
+        return img
+    left, top, right, bottom = bbox
+    pad_x, pad_y = int(img.width * margin), int(img.height * margin)
+    bbox = (max(0, left - pad_x), max(0, top - pad_y), min(img.width, right + pad_x), min(img.height, bottom + pad_y))
+    # Skip crops that barely change anything
+    if (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) > 0.9 * img.width * img.height:
+        return img
+    return img.crop(bbox)
+
+
+def prepare_image(source, max_edge: int = IMAGE_MAX_EDGE, auto_crop: bool = IMAGE_AUTO_CROP, fmt: str = IMAGE_FORMAT, quality: int = IMAGE_QUALITY) -> dict:
+    # Runs once per upload; the result feeds both analyze_clothing and the on-disk copy
+    if isinstance(source, dict):
+        return source
+    img, original_bytes = _read_source(source)
+    img = _flatten(ImageOps.exif_transpose(img))
+    if auto_crop:
+        img = autocrop_background(img)
+    if max(img.size) > max_edge:
+        img = img.copy()
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    fmt = fmt if fmt in FORMAT_INFO else "JPEG"
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, quality=quality, optimize=True)
+    data = buf.getvalue()
+    mime, ext = FORMAT_INFO[fmt]
+    return {
+        "image": img,
+        "bytes": data,
+        "mime": mime,
+        "ext": ext,
+        "original_bytes": original_bytes,
+        "processed_bytes": len(data),
+        "bytes_saved": max(0, original_bytes - len(data)),
+    }
+
+
+def content_filename(prepared: dict) -> str:
+    # Named by content hash: concurrent uploads never collide and a re-upload reuses the same file
+    return f"{hashlib.sha256(prepared['bytes']).hexdigest()[:24]}{prepared['ext']}"
+
+
+def save_prepared_image(prepared: dict, path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(prepared["bytes"])
+    os.replace(tmp_path, path)
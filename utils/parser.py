@@ -0,0 +1,193 @@
+# Single-pass parser for stylist responses
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Mapping, Optional, Tuple, Union
+
+from core.telemetry import timed
+
+MARKER_RE = re.compile(r"===\s*Recommendation\s*\d+\s*===", re.IGNORECASE)
+# Fallback outfit boundary when the model numbers its outfits ("1.", "2)") instead of using markers
+NUMBERED_RE = re.compile(r"^[ \t]*\d+[ \t]*[.)][ \t]+", re.MULTILINE)
+SELECTED_RE = re.compile(r"^[\s*#_]*Selected Items\s*:[\s*_]*(.*)$", re.IGNORECASE)
+NOTES_RE = re.compile(r"^[\s*#_]*Styling Notes\s*:[\s*_]*(.*)$", re.IGNORECASE)
+ITEM_RE = re.compile(r"Item\s*\[?(\d+)\]?\s*:\s*(.*?)\s*(?=(?:-\s*)?Item\s*\[?\d+\]?\s*:|$)", re.IGNORECASE)
+BULLET_RE = re.compile(r"^\s*[-*•]\s*(.*)$")
+# Section headers that follow other text on the same line (responses collapsed onto one line)
+INLINE_HEADER_RE = re.compile(r"[*_]*\s*(?:Selected Items|Styling Notes)\s*:", re.IGNORECASE)
+
+
+@dataclass
+class SelectedItem:
+    item_id: Optional[int]
+    label: str
+
+
+@dataclass
+class Recommendation:
+    text: str
+    items: List[SelectedItem] = field(default_factory=list)
+    notes: str = ""
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def item_ids(self) -> List[int]:
+        return [i.item_id for i in self.items if i.item_id is not None]
+
+
+class _Builder:
+    def __init__(self, start: int):
+        self.start = start
+        self.end = start
+        self.items: List[SelectedItem] = []
+        self.notes: List[str] = []
+        self.section: Optional[str] = None
+        self.seen_selected = False
+        self.seen_notes = False
+        self.unsectioned: List[str] = []
+
+    def feed(self, line: str) -> None:
+        for header in INLINE_HEADER_RE.finditer(line):
+            if line[:header.start()].strip(" *_#"):
+                self.feed(line[:header.start()])
+                self.feed(line[header.start():])
+                return
+        m = SELECTED_RE.match(line)
+        if m:
+            self.section, self.seen_selected = "items", True
+            self._item_text(m.group(1))
+            return
+        m = NOTES_RE.match(line)
+        if m:
+            self.section, self.seen_notes = "notes", True
+            if m.group(1).strip():
+                self.notes.append(m.group(1).strip())
+            return
+        if self.section == "items":
+            self._item_text(line)
+        elif self.section == "notes":
+            self.notes.append(line.rstrip())
+        elif line.strip():
+            self.unsectioned.append(line.strip())
+
+    def _item_text(self, text: str) -> None:
+        if not text.strip():
+            return
+        found = False
+        for m in ITEM_RE.finditer(text):
+            found = True
+            self.items.append(SelectedItem(int(m.group(1)), m.group(2).strip(" -*")))
+        if not found:
+            bullet = BULLET_RE.match(text)
+            if bullet and bullet.group(1).strip():
+                self.items.append(SelectedItem(None, bullet.group(1).strip()))
+            elif text.strip().startswith("("):
+                return
+            elif self.items:
+                # Continuation of the previous item's line
+                self.items[-1].label = f"{self.items[-1].label} {text.strip()}".strip()
+
+    def build(self, raw: str) -> Optional[Recommendation]:
+        text = raw[self.start:self.end].strip()
+        if not text:
+            return None
+        errors = []
+        if not self.seen_selected:
+            errors.append("missing 'Selected Items' section")
+        elif not self.items:
+            errors.append("no selected items")
+        for item in self.items:
+            if item.item_id is None:
+                errors.append(f"item without an ID: {item.label!r}")
+        ids = [i.item_id for i in self.items if i.item_id is not None]
+        for dup in sorted({i for i in ids if ids.count(i) > 1}):
+            errors.append(f"duplicate item ID {dup}")
+        if not self.seen_notes:
+            errors.append("missing 'Styling Notes' section")
+        notes = "\n".join(self.notes).strip()
+        if not self.seen_notes and not self.seen_selected:
+            notes = " ".join(self.unsectioned)
+        return Recommendation(text=text, items=self.items, notes=notes, errors=errors)
+
+
+@timed("parser.parse_response")
+def parse_response(raw: str) -> List[Recommendation]:
+    # One pass over the lines; '=== Recommendation [i] ===' markers start a new recommendation.
+    # Text before the first marker is kept only if it contains an outfit of its own.
+    # Without markers, a numbered list splits the response when two or more entries select items,
+    # so numbered styling tips inside a single outfit stay together.
+    if not raw or not isinstance(raw, str):
+        return []
+    recs = _parse_marked(raw)
+    if len(recs) == 1 and not MARKER_RE.search(raw):
+        numbered = _parse_numbered(raw)
+        if sum(1 for rec in numbered if rec.items) >= 2:
+            return numbered
+    return recs
+
+
+def _parse_numbered(raw: str) -> List[Recommendation]:
+    starts = list(NUMBERED_RE.finditer(raw))
+    if len(starts) < 2:
+        return []
+    recs: List[Recommendation] = []
+    bounds = [(0, starts[0].start())] + [(m.end(), nxt.start() if nxt else len(raw)) for m, nxt in zip(starts, starts[1:] + [None])]
+    for n, (start, end) in enumerate(bounds):
+        builder = _Builder(start)
+        for line in raw[start:end].splitlines():
+            builder.feed(line)
+        builder.end = end
+        rec = builder.build(raw)
+        # Same preamble rule as with markers
+        if rec and not (n == 0 and not rec.items):
+            recs.append(rec)
+    return recs
+
+
+def _parse_marked(raw: str) -> List[Recommendation]:
+    recs: List[Recommendation] = []
+    current = _Builder(0)
+    preamble = True
+    offset = 0
+    for line in raw.splitlines(keepends=True):
+        line_start = offset
+        offset += len(line)
+        pos = 0
+        for m in MARKER_RE.finditer(line):
+            before = line[pos:m.start()]
+            if before.strip():
+                current.feed(before)
+            current.end = line_start + m.start()
+            rec = current.build(raw)
+            if rec and not (preamble and not rec.items):
+                recs.append(rec)
+            preamble = False
+            current = _Builder(line_start + m.end())
+            pos = m.end()
+        current.feed(line[pos:].rstrip("\r\n"))
+        current.end = offset
+    rec = current.build(raw)
+    if rec:
+        recs.append(rec)
+    return recs
+
+
+def parse_one(rec_text: str) -> Recommendation:
+    recs = parse_response(rec_text)
+    return recs[0] if recs else Recommendation(text="", errors=["empty recommendation"])
+
+
+def resolve_items(rec: Recommendation, lookup: Union[Mapping, Callable]) -> Tuple[List, List[str]]:
+    # O(selected items): lookup is an id -> item mapping or a callable such as core.database.get_item
+    get = lookup.get if isinstance(lookup, Mapping) else lookup
+    items, errors = [], []
+    seen = set()
+    for item_id in rec.item_ids:
+        if item_id in seen:
+            continue
+        seen.add(item_id)
+        item = get(item_id)
+        if item is None:
+            errors.append(f"unknown item ID {item_id}")
+        else:
+            items.append(item)
+    return items, errors
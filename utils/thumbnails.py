@@ -0,0 +1,100 @@
+# Thumbnail generation and lightweight image sources for the closet UI
+import os
+import hashlib
+import threading
+from typing import Dict, Optional
+from PIL import Image
+
+from utils.helpers import img_to_b64_data_uri
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+# Streamlit serves ./static at app/static/ when server.enableStaticServing is on (see .streamlit/config.toml)
+STATIC_DIR = os.path.join(ROOT_DIR, 'static')
+IMAGES_DIR = os.path.join(ROOT_DIR, 'data', 'closet_images')
+
+# Longest edge in pixels for each named size
+THUMB_SIZES = {"sm": 320, "md": 640}
+THUMB_FORMAT = os.getenv("THUMB_FORMAT", "WEBP").upper()
+THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", "80"))
+SERVE_STATIC = os.getenv("VARA_STATIC_THUMBS", "0") == "1"
+# Thumbnails only go under ./static when they are meant to be served from there; otherwise they
+# stay in data/ and reach the browser inlined, so nothing is fetchable by URL
+THUMBS_DIR = os.path.join(STATIC_DIR, 'thumbs') if SERVE_STATIC else os.path.join(ROOT_DIR, 'data', 'thumbs')
+
+_EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg"}
+
+
+def thumbnail_path(image_path: str, size: str) -> str:
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    # Source directory hash keeps same-named images from different folders apart
+    tag = hashlib.sha1(os.path.abspath(os.path.dirname(image_path)).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(THUMBS_DIR, f"{stem}-{tag}-{size}{_EXTENSIONS.get(THUMB_FORMAT, '.jpg')}")
+
+
+def _is_fresh(thumb: str, source_mtime: float) -> bool:
+    try:
+        return os.path.getmtime(thumb) >= source_mtime
+    except OSError:
+        return False
+
+
+def make_thumbnails(image_path: str, force: bool = False) -> Dict[str, str]:
+    source_mtime = os.path.getmtime(image_path)
+    paths = {size: thumbnail_path(image_path, size) for size in THUMB_SIZES}
+    if not force and all(_is_fresh(p, source_mtime) for p in paths.values()):
+        return paths
+    os.makedirs(THUMBS_DIR, exist_ok=True)
+    with Image.open(image_path) as img:
+        img = img.convert("RGB") if img.mode != "RGB" else img
+        # Largest first so each smaller size is resampled from an already reduced image
+        for size, edge in sorted(THUMB_SIZES.items(), key=lambda kv: -kv[1]):
+            img = img.copy()
+            img.thumbnail((edge, edge), Image.LANCZOS)
+            tmp_path = f"{paths[size]}.{os.getpid()}.{threading.get_ident()}.tmp"
+            img.save(tmp_path, format=THUMB_FORMAT, quality=THUMB_QUALITY)
+            os.replace(tmp_path, paths[size])
+    return paths
+
+
+def ensure_thumbnails(image_path: str) -> bool:
+    # Save-time hook: a failed thumbnail must never fail the save, thumbnail_src retries lazily
+    try:
+        make_thumbnails(image_path)
+        return True
+    except Exception:
+        return False
+
+
+def thumbnail_src(image_path: str, size: str = "sm") -> str:
+    thumb = thumbnail_path(image_path, size)
+    try:
+        if not _is_fresh(thumb, os.path.getmtime(image_path)):
+            thumb = make_thumbnails(image_path)[size]
+    except Exception:
+        # Fall back to the full image rather than render a broken tile
+        return img_to_b64_data_uri(image_path)
+    if SERVE_STATIC:
+        return f"app/static/thumbs/{os.path.basename(thumb)}"
+    return img_to_b64_data_uri(thumb)
+
+
+def backfill_thumbnails(images_dir: Optional[str] = None) -> int:
+    images_dir = images_dir or IMAGES_DIR
+    created = 0
+    try:
+        names = os.listdir(images_dir)
+    except OSError:
+        return 0
+    for name in names:
+        if os.path.splitext(name)[1].lower() not in (".jpg", ".jpeg", ".png", ".webp"):
+            continue
+        path = os.path.join(images_dir, name)
+        try:
+            mtime = os.path.getmtime(path)
+            if all(_is_fresh(thumbnail_path(path, s), mtime) for s in THUMB_SIZES):
+                continue
+            make_thumbnails(path, force=True)
+            created += 1
+        except Exception:
+            continue
+    return created
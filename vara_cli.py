@@ -0,0 +1,309 @@
+# Headless batch runs: bulk closet import and recommendation batches without the Streamlit UI
+# Run from the repo root:
+#   python vara_cli.py ingest path/to/photos --workers 8
+#   python vara_cli.py recommend occasions.txt -o recommendations.jsonl
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from core.analyzer import analyze_clothing_batch, FALLBACK_ANALYSIS, BATCH_MAX_WORKERS, BATCH_TIMEOUT, BATCH_MAX_RETRIES
+from core.database import save_items, get_closet_view, image_path_for, validate_user_id, DEFAULT_USER, USERS_DIR
+from core.retrieval import build_closet_context
+from core.stylist import get_outfit_recommendation_with_source, get_outfit_variations_with_source, STYLIST_MODE, VARIATION_CONCURRENCY
+from utils.helpers import split_recommendations, parse_analysis
+from utils.images import prepare_image, save_prepared_image, content_filename
+from utils.parser import parse_one
+from utils.thumbnails import ensure_thumbnails
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CHECKPOINT = os.path.join(ROOT_DIR, "data", "ingest_checkpoint.json")
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[pos]
+
+
+def print_stats(label: str, count: int, elapsed: float, latencies, extra: dict | None = None) -> None:
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"\n{label}: {count} in {elapsed:.1f}s ({rate:.2f}/s)")
+    if latencies:
+        print(
+            f"  latency p50 {_percentile(latencies, 50):.2f}s · p95 {_percentile(latencies, 95):.2f}s · "
+            f"max {max(latencies):.2f}s"
+        )
+    for key, value in (extra or {}).items():
+        print(f"  {key}: {value}")
+
+
+def _find_images(directory: str, recursive: bool):
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.abspath(os.path.join(root, name)))
+        if not recursive:
+            break
+    return paths
+
+
+def _load_checkpoint(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _write_checkpoint(path: str, checkpoint: dict) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _source_signature(path: str) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _is_done(checkpoint: dict, path: str) -> bool:
+    entry = checkpoint.get(path)
+    return bool(entry) and all(entry.get(k) == v for k, v in _source_signature(path).items())
+
+
+def _default_checkpoint(user_id: str) -> str:
+    if user_id == DEFAULT_USER:
+        return DEFAULT_CHECKPOINT
+    return os.path.join(USERS_DIR, user_id, "ingest_checkpoint.json")
+
+
+def run_ingest(args) -> int:
+    paths = _find_images(args.directory, args.recursive)
+    args.checkpoint = args.checkpoint or _default_checkpoint(args.user)
+    checkpoint = {} if args.restart else _load_checkpoint(args.checkpoint)
+    todo = [p for p in paths if not _is_done(checkpoint, p)]
+    already = len(paths) - len(todo)
+    if args.limit:
+        todo = todo[:args.limit]
+    print(f"Found {len(paths)} images, {already} already imported, {len(todo)} to go")
+    if not todo:
+        return 0
+
+    latencies, saved, failed, bytes_saved = [], 0, 0, 0
+    started = time.perf_counter()
+    for chunk_start in range(0, len(todo), args.chunk_size):
+        chunk = todo[chunk_start:chunk_start + args.chunk_size]
+        prepared = []
+        for path in chunk:
+            try:
+                with open(path, "rb") as f:
+                    prepared.append(prepare_image(f.read()))
+            except Exception as e:
+                prepared.append(None)
+                failed += 1
+                print(f"  skipped {path}: {e}", file=sys.stderr)
+        valid = [i for i, p in enumerate(prepared) if p is not None]
+        durations = []
+        results = analyze_clothing_batch(
+            [prepared[i] for i in valid],
+            max_workers=args.workers,
+            timeout=args.timeout,
+            max_retries=args.retries,
+            use_cache=not args.no_cache,
+            durations=durations,
+        )
+        # Per-request time of each analysis that went to the API; cache hits are left out
+        latencies.extend(d for d in durations if d is not None)
+        rows, sources = [], []
+        for idx, result in zip(valid, results):
+            parsed = parse_analysis(result)
+            # Fallbacks are left out of the checkpoint so the next run retries them
+            if result == FALLBACK_ANALYSIS or not isinstance(parsed, dict):
+                failed += 1
+                print(f"  analysis failed for {chunk[idx]}", file=sys.stderr)
+                continue
+            image_path = image_path_for(content_filename(prepared[idx]), args.user)
+            try:
+                save_prepared_image(prepared[idx], os.path.join(ROOT_DIR, image_path))
+            except Exception as e:
+                failed += 1
+                print(f"  could not store {chunk[idx]}: {e}", file=sys.stderr)
+                continue
+            try:
+                ensure_thumbnails(os.path.join(ROOT_DIR, image_path))
+            except Exception:
+                pass
+            parsed["analysis_raw"] = result
+            rows.append((parsed, image_path))
+            sources.append(chunk[idx])
+            bytes_saved += prepared[idx]["bytes_saved"]
+        if rows:
+            # One transaction per chunk; the checkpoint is written only after it commits
+            ids = save_items(rows, args.user)
+            for source, item_id, (_item, image_path) in zip(sources, ids, rows):
+                checkpoint[source] = {**_source_signature(source), "id": item_id, "image_path": image_path}
+            _write_checkpoint(args.checkpoint, checkpoint)
+            saved += len(rows)
+        done = min(chunk_start + len(chunk), len(todo))
+        print(f"  {done}/{len(todo)} processed · {saved} saved · {failed} failed")
+
+    print_stats("Ingested", saved, time.perf_counter() - started, latencies, {
+        "failed": failed,
+        "images shrunk by": f"{bytes_saved / (1024 * 1024):,.1f} MB",
+        "checkpoint": args.checkpoint,
+    })
+    return 1 if failed else 0
+
+
+def _read_occasions(path: str):
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _row_done(row: dict) -> bool:
+    # Failed, empty and fallback rows stay in the output but are run again by --resume
+    return bool(row.get("recommendations")) and "error" not in row and not row.get("fallback")
+
+
+def _done_occasions(path: str) -> set:
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except Exception:
+                continue
+            if isinstance(row, dict) and _row_done(row):
+                done.add(row.get("occasion"))
+    return done
+
+
+def _recommend_one(occasion: str, closet_data, args) -> dict:
+    started = time.perf_counter()
+    closet_context, prompt_stats = build_closet_context(occasion, closet_data)
+    if args.parallel and args.mode == "llm":
+        recs, source = get_outfit_variations_with_source(occasion, closet_context, num_variations=args.variations, temperature=args.temperature, seed=args.seed, use_cache=not args.no_cache)
+    else:
+        raw, source = get_outfit_recommendation_with_source(occasion, closet_context, num_variations=args.variations, temperature=args.temperature, seed=args.seed, use_cache=not args.no_cache, mode=args.mode)
+        recs = [] if raw.startswith("Error:") else split_recommendations(raw)
+    parsed = [parse_one(rec) for rec in recs]
+    return {
+        "occasion": occasion,
+        "recommendations": [{"text": rec, "item_ids": p.item_ids, "errors": p.errors} for rec, p in zip(recs, parsed)],
+        "source": source,
+        # Composer outfits standing in for a failed model call in llm/hybrid mode
+        "fallback": source == "local" and args.mode != "local",
+        "prompt_stats": prompt_stats,
+        "latency_s": round(time.perf_counter() - started, 3),
+    }
+
+
+def run_recommend(args) -> int:
+    occasions = _read_occasions(args.occasions)
+    if args.resume:
+        done = _done_occasions(args.output)
+        occasions = [o for o in occasions if o not in done]
+    closet_data = get_closet_view(args.user)
+    if not closet_data:
+        print("Closet is empty, ingest some images first.", file=sys.stderr)
+        return 1
+    print(f"Running {len(occasions)} occasions against {len(closet_data)} items ({args.mode}, {args.workers} workers)")
+    if not occasions:
+        return 0
+
+    latencies, failed, finished = [], 0, 0
+    started = time.perf_counter()
+    with open(args.output, "a" if args.resume else "w") as out:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            futures = {pool.submit(_recommend_one, o, closet_data, args): o for o in occasions}
+            for future in as_completed(futures):
+                try:
+                    row = future.result()
+                except Exception as e:
+                    row = {"occasion": futures[future], "recommendations": [], "error": str(e)}
+                if not _row_done(row):
+                    failed += 1
+                if "latency_s" in row:
+                    latencies.append(row["latency_s"])
+                # Flushed per row so an interrupted run can be picked up with --resume
+                out.write(json.dumps(row) + "\n")
+                out.flush()
+                finished += 1
+                print(f"  {finished}/{len(occasions)} {row['occasion'][:60]}")
+
+    print_stats("Recommended", len(occasions), time.perf_counter() - started, latencies, {
+        "failed or fallback": failed,
+        "output": args.output,
+    })
+    return 1 if failed else 0
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Vara batch closet import and recommendation runs")
+    parser.add_argument("-u", "--user", default=DEFAULT_USER, help="Closet to import into / recommend from")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest = sub.add_parser("ingest", help="Analyze and save a directory of clothing photos")
+    ingest.add_argument("directory")
+    ingest.add_argument("-r", "--recursive", action="store_true", help="Include subdirectories")
+    ingest.add_argument("-w", "--workers", type=int, default=BATCH_MAX_WORKERS, help="Concurrent analysis requests")
+    ingest.add_argument("--chunk-size", type=_positive_int, default=50, help="Images analyzed and committed per checkpoint")
+    ingest.add_argument("--timeout", type=float, default=BATCH_TIMEOUT, help="Per-request timeout in seconds")
+    ingest.add_argument("--retries", type=int, default=BATCH_MAX_RETRIES, help="Retries for rate limits and timeouts")
+    ingest.add_argument("--checkpoint", default=None, help="Progress file used to resume interrupted runs (per user by default)")
+    ingest.add_argument("--restart", action="store_true", help="Ignore the checkpoint and import everything again")
+    ingest.add_argument("--limit", type=int, default=0, help="Only import this many new images")
+    ingest.add_argument("--no-cache", action="store_true", help="Skip the analysis cache")
+    ingest.set_defaults(func=run_ingest)
+
+    recommend = sub.add_parser("recommend", help="Run recommendations for a file of occasions (one per line)")
+    recommend.add_argument("occasions")
+    recommend.add_argument("-o", "--output", default="recommendations.jsonl")
+    recommend.add_argument("-n", "--variations", type=int, default=3)
+    recommend.add_argument("-w", "--workers", type=int, default=4, help="Occasions run concurrently")
+    recommend.add_argument("--mode", choices=["llm", "local", "hybrid"], default=STYLIST_MODE)
+    recommend.add_argument("--parallel", action="store_true", help=f"One request per variation (up to {VARIATION_CONCURRENCY} at once)")
+    recommend.add_argument("--temperature", type=float, default=0.8)
+    recommend.add_argument("--seed", type=int, default=None)
+    recommend.add_argument("--resume", action="store_true", help="Append to the output and skip occasions already in it")
+    recommend.add_argument("--no-cache", action="store_true", help="Skip cached recommendations")
+    recommend.set_defaults(func=run_recommend)
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        args.user = validate_user_id(args.user)
+    except ValueError as e:
+        parser.error(str(e))
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())